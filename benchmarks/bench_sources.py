@@ -0,0 +1,172 @@
+# Benchmarks every source without touching the network: the sample payloads in benchmarks/fixtures (and synthetic
+# copies scaled up by repeating their rate records) go through the parse, transform and Excel write stages, and the
+# timings plus the peak memory of each source are stored in benchmarks/results so that runs can be compared across
+# commits.
+#
+# python benchmarks/bench_sources.py
+# python benchmarks/bench_sources.py --sources SK "PL A" --scales 1 100 --compare benchmarks/results/<earlier run>.json
+
+import sys
+import xml.etree.ElementTree as ElementTree
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import datetime
+from io import BytesIO
+from io import StringIO
+from os import makedirs
+from os.path import abspath
+from os.path import dirname
+from os.path import join
+from subprocess import CalledProcessError
+from subprocess import check_output
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from zipfile import ZIP_DEFLATED
+from zipfile import ZipFile
+import json
+import tracemalloc
+
+benchmarks_folder = dirname(abspath(__file__))
+fixtures_folder = join(benchmarks_folder, "fixtures")
+results_folder = join(benchmarks_folder, "results")
+repo_folder = dirname(benchmarks_folder)
+
+sys.path.insert(0, repo_folder)
+from upload_rates import output
+from upload_rates import parsing
+from upload_rates.sources import rate_sources
+
+fixtures = {"MA": join(repo_folder, "VATSPOTR.txt"), "TR": join(fixtures_folder, "tcmb_today.xml"),
+            "SK": join(fixtures_folder, "ecb_daily.xml"), "RU": join(fixtures_folder, "cbr_daily.xml"),
+            "PL A": join(fixtures_folder, "nbp_a.xml"), "PL B": join(fixtures_folder, "nbp_b.xml")}
+
+
+# repeat every data line of the VATSPOTR extract, then zip it like the real download
+def scale_VATSPOTR(VATSPOTR_location, scale):
+    with open(VATSPOTR_location, "rb") as VATSPOTR_txt:
+        lines = VATSPOTR_txt.read().splitlines(keepends=True)
+    VATSPOTR_zip = BytesIO()
+    with ZipFile(VATSPOTR_zip, "w", ZIP_DEFLATED) as myzip:
+        myzip.writestr("VATSPOTR.txt", b"".join(lines[:2] + lines[2:] * scale))
+    return VATSPOTR_zip.getvalue()
+
+
+# repeat every rate record of the feed next to itself
+def scale_xml(xml_location, spec, scale):
+    rates_etree = ElementTree.parse(xml_location)
+    for parent in list(rates_etree.iter()):
+        scaled_children = []
+        for child in parent:
+            is_record = (parsing.local_name(child.tag) == spec["record"] and
+                         parsing.read_field(child, spec["currency"]) is not None)
+            scaled_children.extend([child] * (scale if is_record else 1))
+        parent[:] = scaled_children
+    return ElementTree.tostring(rates_etree.getroot(), encoding="UTF-8")
+
+
+# the spec of the source without its limit -- TR only takes its first twelve records, so every scale of it would
+# parse and write the same twelve rows
+def benchmark_spec(source):
+    return {field: value for field, value in rate_sources[source].items() if field != "limit"}
+
+
+def run_stages(source, spec, payload, output_folder):
+    timings = {}
+
+    start = perf_counter()
+    if spec.get("format") == "VATSPOTR":
+        records = parsing.parse_VATSPOTR_records(BytesIO(payload), spec)
+    else:
+        records = parsing.parse_records(BytesIO(payload), spec)
+    timings["parse"] = perf_counter() - start
+
+    start = perf_counter()
+    data = parsing.transform_records(records, spec, source)
+    timings["transform"] = perf_counter() - start
+
+    start = perf_counter()
+    with redirect_stdout(StringIO()):
+        output.generate_excel_output(output.generate_header(spec["header"]), data,
+                                     join(output_folder, "{}.xlsx".format(spec["output_name"])), source)
+    timings["write"] = perf_counter() - start
+
+    timings["rows"] = len(data)
+    return timings
+
+
+def benchmark_source(source, scale, repeat, output_folder):
+    spec = benchmark_spec(source)
+    if spec.get("format") == "VATSPOTR":
+        payload = scale_VATSPOTR(fixtures[source], scale)
+    else:
+        payload = scale_xml(fixtures[source], spec, scale)
+
+    # warm up first, e.g. pandas and openpyxl are only imported by the first run
+    run_stages(source, spec, payload, output_folder)
+
+    # best of the repeats, without tracemalloc slowing things down
+    runs = [run_stages(source, spec, payload, output_folder) for _run in range(repeat)]
+    result = {stage: min(run[stage] for run in runs) for stage in ["parse", "transform", "write"]}
+    result["rows"] = runs[0]["rows"]
+    result["payload_bytes"] = len(payload)
+
+    # then once more for the memory
+    tracemalloc.start()
+    run_stages(source, spec, payload, output_folder)
+    result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+
+def current_commit():
+    try:
+        return check_output(["git", "rev-parse", "--short", "HEAD"], cwd=repo_folder).decode().strip()
+    except (CalledProcessError, OSError):
+        return "unknown"
+
+
+def print_results(results, baseline=None):
+    print("{:<6} {:>6} {:>8} {:>11} {:>11} {:>11} {:>12}".format("source", "scale", "rows", "parse ms",
+                                                                  "transform ms", "write ms", "peak KiB"))
+    for key, result in sorted(results.items()):
+        source, scale = key.rsplit(" x", 1)
+        line = "{:<6} {:>6} {:>8} {:>11.2f} {:>11.2f} {:>11.2f} {:>12.0f}".format(
+            source, scale, result["rows"], result["parse"] * 1000, result["transform"] * 1000,
+            result["write"] * 1000, result["peak_memory_bytes"] / 1024)
+        if baseline and key in baseline:
+            line += "   vs baseline: " + ", ".join(
+                "{} {:+.0%}".format(stage, result[stage] / baseline[key][stage] - 1)
+                for stage in ["parse", "transform", "write", "peak_memory_bytes"] if baseline[key][stage])
+        print(line)
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the parse, transform and write stages of every source.")
+    parser.add_argument("--sources", nargs="+", choices=list(fixtures), default=list(fixtures), metavar="SOURCE")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--compare", metavar="RESULTS", help="an earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = {}
+    with TemporaryDirectory() as output_folder:
+        for source in args.sources:
+            for scale in args.scales:
+                results["{} x{}".format(source, scale)] = benchmark_source(source, scale, args.repeat, output_folder)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+    print_results(results, baseline)
+
+    commit = current_commit()
+    makedirs(results_folder, exist_ok=True)
+    results_location = join(results_folder, "{}_{}.json".format(datetime.now().strftime("%Y-%m-%d_%H%M%S"), commit))
+    with open(results_location, "w") as results_file:
+        json.dump({"commit": commit, "date": datetime.now().isoformat(), "results": results}, results_file, indent=2)
+    print("\nResults saved to {}".format(results_location))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# known answers of the cross rates, on small made-up batches (base per foreign, like the feeds after transform_records)
+# python -m unittest discover tests
+from unittest import TestCase
+
+from pandas import DataFrame
+from pandas import Timestamp
+
+from upload_rates.crossrates import cross_rates
+
+
+def batch(base_cur, rates, effective_date="2017-03-17"):
+    return DataFrame([[base_cur, foreign_cur, Timestamp(effective_date), rate] for foreign_cur, rate in rates.items()])
+
+
+class CrossRatesTest(TestCase):
+    def test_direct_through_the_base(self):
+        batches = {"PL A": batch("PLN", {"EUR": 4.3, "TRY": 1.2, "USD": 4.0}),
+                   "TR": batch("TRY", {"EUR": 3.9, "USD": 3.6})}
+        pln_try, eur_usd = cross_rates(batches, [("PLN", "TRY"), ("EUR", "USD")]).itertuples(index=False)
+        self.assertAlmostEqual(pln_try.RATE, 1.2)
+        self.assertEqual(pln_try.PATH, "PL A")
+        self.assertAlmostEqual(eur_usd.RATE, 4.0 / 4.3)  # PLN per USD / PLN per EUR
+        self.assertEqual(eur_usd.PATH, "PL A")
+
+    def test_triangulated_through_a_shared_currency(self):
+        # PL A has no TRY: PLN per TRY = PLN per USD / TRY per USD
+        batches = {"PL A": batch("PLN", {"EUR": 4.3, "USD": 4.0}),
+                   "TR": batch("TRY", {"GBP": 4.5, "USD": 3.6})}
+        pln_try, pln_gbp = cross_rates(batches, [("PLN", "TRY"), ("PLN", "GBP")]).itertuples(index=False)
+        self.assertAlmostEqual(pln_try.RATE, 4.0 / 3.6)
+        self.assertAlmostEqual(pln_gbp.RATE, 4.0 * 4.5 / 3.6)
+        self.assertEqual(pln_gbp.PATH, "PL A > USD > TR")
+
+    def test_direct_and_triangulated_agree(self):
+        direct = cross_rates({"PL A": batch("PLN", {"TRY": 4.0 / 3.6, "USD": 4.0})}, [("PLN", "TRY")])
+        triangulated = cross_rates({"PL A": batch("PLN", {"USD": 4.0}), "TR": batch("TRY", {"USD": 3.6})},
+                                   [("PLN", "TRY")])
+        self.assertAlmostEqual(direct["RATE"][0], triangulated["RATE"][0])
+        self.assertNotEqual(direct["PATH"][0], triangulated["PATH"][0])
+
+    def test_prefers_the_source_based_in_the_pair(self):
+        # MA quotes both EUR and USD in MAD, SK quotes USD in EUR itself
+        batches = {"MA": batch("MAD", {"EUR": 10.7, "USD": 10.0}), "SK": batch("EUR", {"USD": 0.93})}
+        eur_usd, usd_eur = cross_rates(batches, [("EUR", "USD"), ("USD", "EUR")]).itertuples(index=False)
+        self.assertAlmostEqual(eur_usd.RATE, 0.93)
+        self.assertEqual(eur_usd.PATH, "SK")
+        self.assertAlmostEqual(usd_eur.RATE, 1 / 0.93)
+        self.assertEqual(usd_eur.PATH, "SK")
+
+    def test_unknown_currency(self):
+        unknown = cross_rates({"PL A": batch("PLN", {"USD": 4.0})}, [("PLN", "XYZ")])
+        self.assertTrue(unknown["RATE"].isna()[0])
+        self.assertIsNone(unknown["PATH"][0])
@@ -0,0 +1,4 @@
+# Author - Michal Zawadzki, michalmzawadzki@gmail.com. Updates/modifications highly encouraged (infoanarchism!). :)
+
+# Generates the currency rates upload files from the central banks' feeds -- run it with python -m upload_rates.
+# Importing the package doesn't run anything nor import pandas/openpyxl.
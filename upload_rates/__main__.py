@@ -0,0 +1,5 @@
+import sys
+
+from upload_rates.cli import main
+
+sys.exit(main())
@@ -0,0 +1,90 @@
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from threading import Lock
+from urllib.error import HTTPError
+
+from upload_rates.downloads import stream_xml_records
+from upload_rates.downloads import wait_for_host
+from upload_rates.output import generate_output_folder
+from upload_rates.output import write_batch
+from upload_rates.parsing import transform_records
+from upload_rates.sources import rate_sources
+
+
+def history_spec(source):
+    return dict(rate_sources[source], **rate_sources[source]["history"])
+
+
+# CBR answers every day with the last rates published before it, so the same batch can come back for several days
+# -- claim each (source, effective date) so that it's written only once
+backfilled_batches = set()
+backfilled_batches_lock = Lock()
+
+
+def claim_batch(source, effective_date):
+    with backfilled_batches_lock:
+        if (source, effective_date) in backfilled_batches:
+            return False
+        backfilled_batches.add((source, effective_date))
+        return True
+
+
+def backfill_day(source, rates_date, formats=None):
+    from pandas import DataFrame
+
+    spec = history_spec(source)
+    rates_url = spec["url"].format(date=rates_date)
+    wait_for_host(rates_url)
+    try:
+        records = DataFrame.from_records(stream_xml_records(rates_url, spec),
+                                         columns=["currency", "effective_date", "rate", "normalizer"])
+    except HTTPError as e:
+        if e.code == 404:  # nothing published that day, e.g. a weekend or a bank holiday
+            return
+        raise
+    if records.empty:
+        return
+    data = transform_records(records, spec, source)
+    effective_date = data.iloc[0, 2]
+    if claim_batch(source, effective_date):
+        write_batch(source, data, generate_output_folder(effective_date), formats, validate=False)
+
+
+# the whole history comes in one (large) feed -- stream it, keep the requested days and write one batch per day
+def backfill_feed(source, start_date, end_date, formats=None):
+    from pandas import DataFrame
+
+    spec = history_spec(source)
+    wait_for_host(spec["url"])
+    records = DataFrame.from_records(stream_xml_records(spec["url"], spec),
+                                     columns=["currency", "effective_date", "rate", "normalizer"])
+    data = transform_records(records, spec, source)
+    data = data[(data[2] >= start_date) & (data[2] <= end_date)]
+    for effective_date, day_data in data.groupby(2):
+        if claim_batch(source, effective_date):
+            write_batch(source, day_data.reset_index(drop=True), generate_output_folder(effective_date), formats,
+                        validate=False)
+
+
+# regenerate every day from start_date to end_date, fanning the requests out across a worker pool
+def backfill(start_date, end_date, sources, max_workers=8, formats=None):
+    from pandas import date_range
+    from pandas import to_datetime
+
+    start_date, end_date = to_datetime(start_date), to_datetime(end_date)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for source in sources:
+            if "history" not in rate_sources[source]:
+                print("{} has no dated endpoint, it can't be backfilled.\n".format(source))
+            elif rate_sources[source]["history"]["per_day"]:
+                for rates_date in date_range(start_date, end_date):
+                    futures[executor.submit(backfill_day, source, rates_date, formats)] = (source, rates_date)
+            else:
+                futures[executor.submit(backfill_feed, source, start_date, end_date, formats)] = (source, start_date)
+        for future in as_completed(futures):
+            source, rates_date = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print("{} {} crashed: {}\n".format(source, rates_date.strftime("%Y-%m-%d"), e))
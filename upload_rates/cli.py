@@ -0,0 +1,249 @@
+# the entry point -- nothing runs on import, and the heavy stages are only imported by the commands that need them,
+# so that --status and --dry-run answer right away
+from argparse import ArgumentParser
+from argparse import ArgumentTypeError
+from datetime import datetime
+from os.path import exists
+import sys
+
+from upload_rates.output import output_writers
+from upload_rates.sources import rate_sources
+
+
+def sources_due(now):
+    if now.hour > 12:
+        sources_in_scope = ["MA", "TR", "SK", "PL A"]
+    else:
+        # only generate RU in the morning
+        sources_in_scope = ["RU"]
+
+    # only generate PL_B rates on Wednesday
+    if now.weekday() == 2:
+        sources_in_scope.append("PL B")
+    return sources_in_scope
+
+
+def print_status():
+    from upload_rates.downloads import http_cache_path
+    from upload_rates.downloads import load_http_cache
+    from upload_rates.history import history_path
+    from upload_rates.history import history_status
+
+    from upload_rates.currencies import currency_codes_path
+    from upload_rates.currencies import load_currency_codes
+
+    print("Sources due now: {}".format(", ".join(sources_due(datetime.now()))))
+    print("Currency codes ({}): version {}, updated {}".format(currency_codes_path, load_currency_codes()["version"],
+                                                               load_currency_codes()["updated"]))
+    print("Feeds in the HTTP cache ({}): {}".format(http_cache_path, len(load_http_cache())))
+    if not exists(history_path):
+        print("No rate history yet ({})".format(history_path))
+        return
+    print("Rate history ({}):".format(history_path))
+    for source, last_effective_date, number_of_rates in history_status():
+        print("    {:<5} last effective date {}, {} rates".format(source, last_effective_date, number_of_rates))
+
+
+def print_dry_run(sources_in_scope, rates_date, formats=None):
+    for source in sources_in_scope:
+        spec = rate_sources[source]
+        print("{:<5} {} -> {}_RATES_<effective date> as {}".format(source, spec["url"].format(date=rates_date),
+                                                                  spec["output_name"],
+                                                                  ", ".join(formats or spec.get("formats", ["xlsx"]))))
+
+
+def currency_pair(pair):
+    currencies = pair.upper().split("/")
+    if len(currencies) != 2:
+        raise ArgumentTypeError("{} is not a BASE/FOREIGN pair".format(pair))
+    return tuple(currencies)
+
+
+# the stages measure() wraps, "write" being all the write_<format> ones
+profiled_stages = ["download", "parse", "transform", "validate", "write", "history"]
+
+
+def profile_target(target):
+    source, _, stage = target.partition(":")
+    if source not in rate_sources:
+        raise ArgumentTypeError("{} is not one of the sources: {}".format(source, ", ".join(rate_sources)))
+    if stage and stage not in profiled_stages + ["write_" + output_format for output_format in output_writers]:
+        raise ArgumentTypeError("{} is not one of the stages: {}".format(stage, ", ".join(profiled_stages)))
+    return source, stage or None
+
+
+# pairs: [("PLN", "TRY"), ...], all of them if empty
+def print_cross_rates(pairs):
+    from upload_rates.crossrates import batches_from_history
+    from upload_rates.crossrates import cross_rates
+    from upload_rates.history import history_path
+    from upload_rates.output import generate_output_folder
+
+    if not exists(history_path):
+        print("No rate history yet ({})".format(history_path))
+        return
+    if pairs:
+        print(cross_rates(batches_from_history(), pairs).to_string(index=False))
+        return
+    cross_rates_path = generate_output_folder() + "\\CROSS_RATES_" + datetime.now().strftime("%Y-%m-%d") + ".csv"
+    cross_rates(batches_from_history()).to_csv(cross_rates_path, index=False, date_format="%Y-%m-%d")
+    print("Cross rates generated to {} :)".format(cross_rates_path))
+
+
+# returns the exit status: 1 if some batches couldn't be uploaded
+def main(argv=None):
+    parser = ArgumentParser(prog="upload_rates", description="Generate the currency rates upload files.")
+    parser.add_argument("--backfill", nargs=2, metavar=("START", "END"),
+                        help="regenerate every day from START to END, e.g. --backfill 2017-03-01 2017-03-31")
+    parser.add_argument("--sources", nargs="+", choices=list(rate_sources), metavar="SOURCE",
+                        help="the sources to generate: {}".format(", ".join(rate_sources)))
+    parser.add_argument("--formats", nargs="+", choices=list(output_writers), metavar="FORMAT",
+                        help="write these formats instead of each source's own: {}".format(", ".join(output_writers)))
+    parser.add_argument("--timeouts", nargs=2, type=float, metavar=("CONNECT", "READ"),
+                        help="connect and read timeouts of the downloads in seconds (default 5 and 30)")
+    parser.add_argument("--retries", type=int, help="how many times a failed download is retried (default 4)")
+    parser.add_argument("--all-slices", action="store_true",
+                        help="also write every other rate type/base currency slice of the VATSPOTR extract")
+    parser.add_argument("--render-processes", type=int, metavar="N",
+                        help="write the output files in N processes (e.g. the number of cores)")
+    parser.add_argument("--consolidated", action="store_true",
+                        help="write the day's xlsx batches as the sheets of a single DAILY_RATES workbook")
+    parser.add_argument("--no-validation", action="store_true",
+                        help="don't hold back the batches that moved too much since the previous rates")
+    parser.add_argument("--delta", action="store_true",
+                        help="only write the rates that changed since each source's last batch")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and generate every source as soon as its bank publishes")
+    parser.add_argument("--cross", nargs="*", type=currency_pair, metavar="BASE/FOREIGN",
+                        help="derive these pairs from the latest rates in the history, e.g. PLN/TRY (PLN per TRY), "
+                             "or the full cross table if none are given")
+    parser.add_argument("--upload", metavar="URL",
+                        help="upload the batches of the run to the rates import endpoint at URL")
+    parser.add_argument("--metrics", nargs="?", const="Rates\\metrics", metavar="FOLDER",
+                        help="write a JSON run report and a Prometheus textfile of the stages' timings into FOLDER "
+                             "(default Rates\\metrics)")
+    parser.add_argument("--profile", type=profile_target, metavar="SOURCE[:STAGE]",
+                        help="profile a source, or one of its stages ({}), e.g. --profile MA:parse".format(
+                            ", ".join(profiled_stages)))
+    parser.add_argument("--force", action="store_true",
+                        help="download and generate every source, even if its feed hasn't changed since the last run")
+    parser.add_argument("--status", action="store_true", help="show the cache and the rate history, and exit")
+    parser.add_argument("--dry-run", action="store_true", help="show what would be downloaded, and exit")
+    parser.add_argument("--no-wait", action="store_true", help="don't wait for ENTER at the end of the run")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        print_status()
+        return
+
+    if args.cross is not None:
+        print_cross_rates(args.cross)
+        return
+
+    if args.force and args.daemon:
+        parser.error("--force would have the daemon regenerate the same rates at every poll")
+
+    if args.timeouts or args.retries is not None:
+        from upload_rates.client import http_client
+
+        if args.timeouts:
+            http_client.connect_timeout, http_client.read_timeout = args.timeouts
+        if args.retries is not None:
+            http_client.retries = args.retries
+
+    # before the dispatch, so that they hold for the daemon too
+    if args.metrics:
+        from importlib import import_module
+        from upload_rates import metrics
+
+        # tracing the allocations makes the lazy imports several times slower, so they are done before it starts
+        import_module("pandas")
+        import_module("openpyxl")
+        metrics.start_memory_tracing()
+
+    if args.force:
+        from upload_rates import downloads
+
+        downloads.http_cache_enabled = False
+
+    if args.no_validation:
+        from upload_rates import validation
+
+        validation.validation_enabled = False
+
+    if args.all_slices:
+        for spec in rate_sources.values():
+            if spec.get("format") == "VATSPOTR":
+                spec["all_slices"] = True
+
+    if args.backfill:
+        from upload_rates.backfill import backfill
+
+        backfill(*args.backfill, sources=args.sources or [source for source in rate_sources
+                                                          if "history" in rate_sources[source]],
+                 formats=args.formats)
+        return
+
+    if args.daemon:
+        from upload_rates.scheduler import run_daemon
+
+        try:
+            run_daemon(args.sources or list(rate_sources), formats=args.formats, delta=args.delta,
+                       metrics_folder=args.metrics, upload_endpoint=args.upload)
+        except KeyboardInterrupt:
+            print("Stopped")
+        return
+
+    if args.profile:
+        from importlib import import_module
+        from upload_rates import profiling
+
+        # import pandas up front, so that the profile shows the work and not the lazy import
+        import_module("pandas")
+        profiling.profile_target = args.profile
+
+    sources_in_scope = args.sources or ([args.profile[0]] if args.profile else sources_due(datetime.now()))
+    if args.dry_run:
+        print_dry_run(sources_in_scope, datetime.now(), args.formats)
+        return
+
+    from upload_rates.generate import generate_all
+
+    if args.render_processes:
+        from concurrent.futures import ProcessPoolExecutor
+        from upload_rates import output
+
+        output.render_pool = ProcessPoolExecutor(max_workers=args.render_processes)
+    if args.consolidated:
+        from upload_rates import output
+
+        output.daily_workbook = output.DailyWorkbook()
+    if args.upload:
+        from upload_rates import upload
+
+        upload.upload_queue = upload.UploadQueue()
+    generate_all(sources_in_scope, formats=args.formats, delta=args.delta)
+    if args.consolidated:
+        output.daily_workbook.save("{}\\DAILY_RATES_{}.xlsx".format(output.generate_output_folder(),
+                                                                   datetime.now().strftime("%Y-%m-%d")))
+    if args.render_processes:
+        output.render_pool.shutdown()
+    upload_failures = 0
+    if args.upload:
+        upload_failures = upload.upload_batches(args.upload, upload.upload_queue.take())
+    if args.metrics:
+        from upload_rates.metrics import write_metrics
+
+        write_metrics(args.metrics)
+    if args.profile:
+        from upload_rates.output import generate_output_folder
+
+        profiling.save_profiles(generate_output_folder())
+
+    if not args.no_wait:
+        input("Press ENTER to enter the Matrix")
+    return 1 if upload_failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
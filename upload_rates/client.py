@@ -0,0 +1,244 @@
+# one HTTP client shared by every download: keep-alive connections pooled per host, separate connect/read timeouts,
+# gzip, and retries with jittered exponential backoff, so that a hiccup at one bank costs a second or two instead of
+# the whole run
+# like urlopen, it goes through the proxy of the *_proxy environment variables or of the system settings (the registry
+# on Windows), with a CONNECT tunnel for https
+from base64 import b64encode
+from http.client import HTTPConnection
+from http.client import HTTPException
+from http.client import HTTPSConnection
+from gzip import GzipFile
+from random import uniform
+from threading import Lock
+from time import sleep
+from urllib.error import HTTPError
+from urllib.parse import urljoin
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+from urllib.parse import urlunsplit
+
+
+retryable_statuses = {429, 500, 502, 503, 504}
+redirect_statuses = {301, 302, 303, 307, 308}
+
+
+# the body as it comes in, before the gzip decompression, counting its bytes
+class CountingReader:
+    def __init__(self, response):
+        self.response = response
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = self.response.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+# a response whose connection goes back to the pool once the body has been read to the end
+class PooledResponse:
+    def __init__(self, client, pool_key, connection, response):
+        self.client = client
+        self.pool_key = pool_key
+        self.connection = connection
+        self.response = response
+        self.status = response.status
+        self.headers = response.headers
+        self.received = CountingReader(response)
+        if response.getheader("Content-Encoding", "").lower() == "gzip":
+            self.body = GzipFile(fileobj=self.received, mode="rb")
+        else:
+            self.body = self.received
+
+    def read(self, size=None):
+        return self.body.read(size)
+
+    def close(self):
+        if self.connection is None:
+            return
+        # only a fully read response leaves the connection in a reusable state
+        if self.response.isclosed() and not self.response.will_close:
+            self.client.release(self.pool_key, self.connection)
+        else:
+            self.connection.close()
+        self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class HttpClient:
+    # host_timeouts: {host: (connect timeout, read timeout)} for the hosts that need their own
+    def __init__(self, connect_timeout=5, read_timeout=30, retries=4, backoff=0.5, max_backoff=8,
+                 max_idle_per_host=4, host_timeouts=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_idle_per_host = max_idle_per_host
+        self.host_timeouts = host_timeouts or {}
+        self.idle_connections = {}
+        self.lock = Lock()
+        # {scheme: proxy url}, read on the first request
+        self.proxies = None
+        # {pool key: (proxy host, proxy port, Proxy-Authorization or None) or None if it's reached directly}
+        self.routes = {}
+
+    def timeouts(self, host):
+        return self.host_timeouts.get(host, (self.connect_timeout, self.read_timeout))
+
+    # the proxy urlopen would pick for the host, minus no_proxy and the bypass list of the system settings:
+    # (proxy host, proxy port, Proxy-Authorization or None), or None to connect directly
+    def route(self, pool_key):
+        from urllib.request import getproxies
+        from urllib.request import proxy_bypass
+
+        if pool_key in self.routes:
+            return self.routes[pool_key]
+        scheme, host, port = pool_key
+        if self.proxies is None:
+            self.proxies = getproxies()
+        proxy_url = self.proxies.get(scheme)
+        if not proxy_url or proxy_bypass(host):
+            self.routes[pool_key] = None
+            return None
+        proxy = urlsplit(proxy_url if "://" in proxy_url else "http://" + proxy_url)
+        authorization = None
+        if proxy.username:
+            credentials = "{}:{}".format(unquote(proxy.username), unquote(proxy.password or ""))
+            authorization = "Basic " + b64encode(credentials.encode()).decode()
+        self.routes[pool_key] = (proxy.hostname, proxy.port or 80, authorization)
+        return self.routes[pool_key]
+
+    # returns (connection, whether it's a reused one)
+    def acquire(self, pool_key):
+        with self.lock:
+            idle = self.idle_connections.get(pool_key)
+            if idle:
+                return idle.pop(), True
+        scheme, host, port = pool_key
+        connect_timeout, read_timeout = self.timeouts(host)
+        connection_class = HTTPSConnection if scheme == "https" else HTTPConnection
+        proxy = self.route(pool_key)
+        if proxy is None:
+            connection = connection_class(host, port, timeout=connect_timeout)
+        else:
+            proxy_host, proxy_port, authorization = proxy
+            connection = connection_class(proxy_host, proxy_port, timeout=connect_timeout)
+            if scheme == "https":
+                connection.set_tunnel(host, port, headers={"Proxy-Authorization": authorization} if authorization
+                                      else None)
+        connection.connect()
+        connection.sock.settimeout(read_timeout)
+        return connection, False
+
+    def release(self, pool_key, connection):
+        with self.lock:
+            idle = self.idle_connections.setdefault(pool_key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            for idle in self.idle_connections.values():
+                for connection in idle:
+                    connection.close()
+            self.idle_connections.clear()
+
+    # full jitter: anywhere between 0 and the exponential backoff of the attempt
+    def wait_before_retry(self, attempt):
+        sleep(uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def send(self, method, url, headers, body):
+        parts = urlsplit(url)
+        pool_key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        request_headers = {"Accept-Encoding": "gzip", "User-Agent": "upload_rates"}
+        proxy = self.route(pool_key)
+        if proxy and parts.scheme == "http":
+            # a plain HTTP proxy gets the whole URL, https goes through the tunnel as usual
+            path = urlunsplit(parts._replace(fragment=""))
+            if proxy[2]:
+                request_headers["Proxy-Authorization"] = proxy[2]
+        request_headers.update(headers or {})
+
+        connection, reused = self.acquire(pool_key)
+        try:
+            connection.request(method, path, body=body, headers=request_headers)
+            response = connection.getresponse()
+        except (OSError, HTTPException):
+            connection.close()
+            if not reused:
+                raise
+            # the server dropped the idle connection in the meantime -- that's not worth a backoff, just reconnect
+            return self.send(method, url, headers, body)
+        return PooledResponse(self, pool_key, connection, response)
+
+    # returns a PooledResponse for 2xx, raises urllib's HTTPError for anything else (e.g. 304, 404), like urlopen
+    # idempotent requests are retried on connection errors and on 429/5xx
+    def request(self, method, url, headers=None, body=None, idempotent=None, max_redirects=5):
+        if idempotent is None:
+            idempotent = method in ("GET", "HEAD", "PUT", "DELETE")
+        attempts = self.retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            try:
+                response = self.send(method, url, headers, body)
+            except (OSError, HTTPException):
+                if attempt == attempts - 1:
+                    raise
+                self.wait_before_retry(attempt)
+                continue
+
+            if response.status in redirect_statuses and max_redirects:
+                location = response.headers.get("Location")
+                response.read()
+                response.close()
+                if method not in ("GET", "HEAD") and response.status == 303:
+                    method, body = "GET", None
+                return self.request(method, urljoin(url, location), headers, body, idempotent, max_redirects - 1)
+            if response.status in retryable_statuses and attempt < attempts - 1:
+                response.read()
+                response.close()
+                self.wait_before_retry(attempt)
+                continue
+            if response.status >= 300:
+                response.read()
+                response.close()
+                raise HTTPError(url, response.status, response.response.reason, response.headers, None)
+            return response
+
+    def get(self, url, headers=None):
+        return self.request("GET", url, headers)
+
+    # GET url into destination, and GET it again if the body breaks off halfway (a read timeout, a reset...) --
+    # returns the headers of the response and the bytes of body received (as sent, i.e. gzipped if it came gzipped,
+    # the attempts that broke off included), with destination rewound to the start of the body
+    def download(self, url, destination, headers=None, chunk_size=64 * 1024):
+        bytes_received = 0
+        for attempt in range(self.retries + 1):
+            response = self.get(url, headers)
+            destination.seek(0)
+            destination.truncate()
+            try:
+                with response:
+                    for chunk in iter(lambda: response.read(chunk_size), b""):
+                        destination.write(chunk)
+            except (OSError, EOFError, HTTPException):
+                if attempt == self.retries:
+                    raise
+                self.wait_before_retry(attempt)
+                continue
+            finally:
+                bytes_received += response.received.bytes_read
+            destination.seek(0)
+            return response.headers, bytes_received
+
+
+http_client = HttpClient()
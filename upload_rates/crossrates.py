@@ -0,0 +1,175 @@
+# pairs that no feed publishes, e.g. PLN/TRY, derived from the rates we already have instead of from extra feeds
+# every batch quotes its foreign currencies in its own base, so one source gives any pair of its currencies directly
+# (PLN per TRY = PLN per EUR / TRY per EUR, through its base). Pairs that no single source covers are triangulated:
+# the sources are chained through a currency they have in common (e.g. SK and PL A through USD) into one common unit.
+# Everything is done on a sources x currencies matrix with NumPy, so the full cross table is a few array operations,
+# and every rate carries the path it was derived through.
+from upload_rates.output import output_columns
+
+cross_rates_columns = output_columns + ["PATH"]
+
+
+# batches: {source: data}, with the usual base currency, foreign currency, effective date, rate columns
+# only the latest effective date of each batch is used
+# returns the sources, the currencies, the effective date of each source, the matrix of base-per-foreign values
+# (the base itself is 1, a currency the source doesn't quote is NaN) and the column of each source's base
+def rate_matrix(batches):
+    from numpy import full
+    from numpy import nan
+
+    latest = {}
+    for source, data in batches.items():
+        latest[source] = data[data[2] == data[2].max()]
+    sources = list(latest)
+    currencies = sorted(set().union(*[set(data[0]) | set(data[1]) for data in latest.values()]))
+    position = {currency: column for column, currency in enumerate(currencies)}
+
+    values = full((len(sources), len(currencies)), nan)
+    for row, source in enumerate(sources):
+        data = latest[source]
+        values[row, data[1].map(position).to_numpy()] = data[3].to_numpy(dtype=float)
+        values[row, data[0].map(position).to_numpy()] = 1.0
+    dates = [latest[source][2].max() for source in sources]
+    bases = [position[latest[source].iloc[0, 0]] for source in sources]
+    return sources, currencies, dates, values, bases
+
+
+# links every source it can to the one quoting the most currencies, each through a currency it has in common with the
+# closest source already linked (the sources are only a handful, the currencies are what's vectorised)
+# returns each source's value of its base in the unit of the first one's base (NaN if it couldn't be linked) and its
+# chain, e.g. ["SK", "USD", "TR"]: TR linked to SK through USD
+def link_sources(sources, currencies, values):
+    from numpy import full
+    from numpy import isnan
+    from numpy import nan
+
+    quoted = ~isnan(values)
+    anchor = quoted.sum(axis=1).argmax()
+    factors = full(len(sources), nan)
+    factors[anchor] = 1.0
+    chains = {anchor: [sources[anchor]]}
+    linked = True
+    while linked:
+        linked = False
+        for parent in sorted(chains, key=lambda row: len(chains[row])):
+            for row in range(len(sources)):
+                shared = quoted[row] & quoted[parent]
+                if row in chains or not shared.any():
+                    continue
+                column = shared.argmax()
+                factors[row] = factors[parent] * values[parent, column] / values[row, column]
+                chains[row] = chains[parent] + [currencies[column], sources[row]]
+                linked = True
+            if linked:
+                break
+    return factors, chains
+
+
+# the way from one source to the other through the chains, e.g. "TR > USD > SK > EUR > PL A"
+def chain_path(chain_a, chain_b):
+    common = 0
+    while common < min(len(chain_a), len(chain_b)) and chain_a[common] == chain_b[common]:
+        common += 1
+    if common % 2 == 0:  # the chains part after a shared currency, go back to the source before it
+        common -= 1
+    return " > ".join(chain_a[common:][::-1] + [chain_a[common - 1]] + chain_b[common:])
+
+
+# the full table of rates of every currency (base) per every other one (foreign), its effective dates and paths
+# each is a currencies x currencies array
+def cross_table(batches):
+    from numpy import arange
+    from numpy import array
+    from numpy import errstate
+    from numpy import isnan
+    from numpy import take_along_axis
+    from numpy import where
+    from numpy import zeros
+
+    sources, currencies, dates, values, bases = rate_matrix(batches)
+    number_of_sources = len(sources)
+    quoted = ~isnan(values)
+
+    # directly: base per foreign = its value of the foreign / its value of the base, from the first source quoting
+    # both that has one of them as its own base (e.g. EUR/USD from the ECB's reference rate rather than from the MAD
+    # sell rates of MA), otherwise from the first one quoting both
+    both_quoted = quoted[:, :, None] & quoted[:, None, :]
+    is_base = zeros(quoted.shape, dtype=bool)
+    is_base[arange(number_of_sources), bases] = True
+    preference = both_quoted * (1 + (is_base[:, :, None] | is_base[:, None, :]))
+    direct_source = preference.argmax(axis=0)
+    with errstate(divide="ignore", invalid="ignore"):
+        direct = take_along_axis(values[:, None, :] / values[:, :, None], direct_source[None], axis=0)[0]
+
+    # triangulated: every currency in the unit of the anchor's base, from the first linked source quoting it
+    factors, chains = link_sources(sources, currencies, values)
+    anchored = factors[:, None] * values
+    home_source = (~isnan(anchored)).argmax(axis=0)
+    common_values = anchored[home_source, arange(len(currencies))]
+    with errstate(divide="ignore", invalid="ignore"):
+        triangulated = common_values[None, :] / common_values[:, None]
+
+    # the paths are labelled once per source (direct) and once per pair of sources (triangulated), then looked up
+    paths = list(sources)
+    path_dates = list(dates)
+    for source_a in range(number_of_sources):
+        for source_b in range(number_of_sources):
+            if source_a in chains and source_b in chains:
+                chain = chain_path(chains[source_a], chains[source_b])
+                paths.append(chain)
+                path_dates.append(min(dates[sources.index(source)] for source in chain.split(" > ")
+                                      if source in sources))
+            else:
+                paths.append(None)
+                path_dates.append(None)
+    has_direct = both_quoted.any(axis=0)
+    path_index = where(has_direct, direct_source,
+                       number_of_sources + home_source[:, None] * number_of_sources + home_source[None, :])
+    rates = where(has_direct, direct, triangulated)
+    derived = ~isnan(rates)
+    return (currencies, rates, where(derived, array(path_dates, dtype=object)[path_index], None),
+            where(derived, array(paths, dtype=object)[path_index], None))
+
+
+# pairs: [(base, foreign), ...], None for every pair of different currencies
+# returns the upload columns plus PATH; a pair that can't be derived gets a NaN rate and no path
+def cross_rates(batches, pairs=None):
+    from numpy import isnan
+    from numpy import nonzero
+    from pandas import DataFrame
+
+    currencies, rates, dates, paths = cross_table(batches)
+    if pairs is None:
+        bases, foreigns = nonzero(~isnan(rates))
+        keep = bases != foreigns
+        bases, foreigns = bases[keep], foreigns[keep]
+        base_currencies = [currencies[base] for base in bases]
+        foreign_currencies = [currencies[foreign] for foreign in foreigns]
+        return DataFrame({"BASE_CURRENCY": base_currencies, "FOREIGN_CURRENCY": foreign_currencies,
+                          "EFFECTIVE_DATE": dates[bases, foreigns], "RATE": rates[bases, foreigns],
+                          "PATH": paths[bases, foreigns]}, columns=cross_rates_columns)
+
+    position = {currency: column for column, currency in enumerate(currencies)}
+    rows = []
+    for base_cur, foreign_cur in pairs:
+        if base_cur in position and foreign_cur in position:
+            base, foreign = position[base_cur], position[foreign_cur]
+            rows.append([base_cur, foreign_cur, dates[base, foreign], rates[base, foreign], paths[base, foreign]])
+        else:
+            rows.append([base_cur, foreign_cur, None, float("nan"), None])
+    return DataFrame(rows, columns=cross_rates_columns)
+
+
+# the latest batch of every source in the rate history, in the order of the registry
+def batches_from_history(history_location=None):
+    from upload_rates.history import read_latest_history
+    from upload_rates.sources import rate_sources
+
+    latest = read_latest_history(history_location)
+    batches = {}
+    for source in rate_sources:
+        data = latest[latest["source"] == source]
+        if len(data):
+            batches[source] = data[["base_currency", "foreign_currency", "effective_date", "rate"]].set_axis(
+                [0, 1, 2, 3], axis=1).reset_index(drop=True)
+    return batches
@@ -0,0 +1,38 @@
+# one translation and exclusion table of currency codes for every source, kept in currency_codes.json so that a new
+# legacy code is a data change instead of a code change
+# each source's table is compiled once, and a batch's currency column is then translated through its distinct codes
+# (a handful) instead of running DataFrame.replace over every column of the frame
+from functools import lru_cache
+from os.path import dirname
+from os.path import join
+import json
+
+currency_codes_path = join(dirname(__file__), "currency_codes.json")
+
+
+@lru_cache(maxsize=None)
+def load_currency_codes():
+    with open(currency_codes_path) as currency_codes_file:
+        return json.load(currency_codes_file)
+
+
+# returns ({ISO code: upload code}, {excluded ISO codes}) -- the common ones plus the source's own
+@lru_cache(maxsize=None)
+def currency_table(source=None):
+    currency_codes = load_currency_codes()
+    source_codes = currency_codes["sources"].get(source, {})
+    translations = dict(currency_codes["translations"], **source_codes.get("translations", {}))
+    exclusions = frozenset(currency_codes["exclusions"]) | frozenset(source_codes.get("exclusions", []))
+    return translations, exclusions
+
+
+# returns the translated codes and a mask of the ones to keep, as arrays aligned with currencies
+def translate_currencies(currencies, source=None):
+    from numpy import array
+    from pandas import factorize
+
+    translations, exclusions = currency_table(source)
+    codes, distinct_currencies = factorize(currencies, use_na_sentinel=False)
+    translated = array([translations.get(currency, currency) for currency in distinct_currencies], dtype=object)
+    excluded = array([currency in exclusions for currency in distinct_currencies], dtype=bool)
+    return translated[codes], ~excluded[codes]
@@ -0,0 +1,144 @@
+from urllib.parse import urlparse
+from urllib.error import HTTPError
+from http.client import HTTPException
+from hashlib import sha256
+from io import BytesIO
+from os import makedirs
+from os.path import dirname
+from tempfile import SpooledTemporaryFile
+from threading import Lock
+from time import sleep
+from time import monotonic
+import json
+
+from upload_rates.client import http_client
+from upload_rates.metrics import record_stage
+from upload_rates.parsing import iter_records
+
+
+# remember the ETag/Last-Modified and a hash of the body of every feed, so that a feed which has not changed since the
+# last run is neither downloaded again (304) nor parsed and written again (same hash)
+# a new entry is only kept once its batch has been written (see save_http_cache), so that a run which crashed, couldn't
+# write its files or held the batch back gets the same feed again next time
+http_cache_path = "Rates\\http_cache.json"
+http_cache_lock = Lock()
+# the entries of the feeds downloaded but not written yet: {url: cache entry}
+pending_http_cache = {}
+# --force: download and generate every feed whether it has changed or not
+http_cache_enabled = True
+
+
+def load_http_cache():
+    try:
+        with open(http_cache_path) as http_cache_file:
+            return json.load(http_cache_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def update_http_cache(url, cache_entry):
+    with http_cache_lock:
+        http_cache = load_http_cache()
+        http_cache[url] = cache_entry
+        # on the first run, Rates may not be there yet
+        if dirname(http_cache_path):
+            makedirs(dirname(http_cache_path), exist_ok=True)
+        with open(http_cache_path, "w") as http_cache_file:
+            json.dump(http_cache, http_cache_file, indent=2, sort_keys=True)
+
+
+# the batch of url has been written, remember its feed
+def save_http_cache(url):
+    with http_cache_lock:
+        cache_entry = pending_http_cache.pop(url, None)
+    if cache_entry is not None:
+        update_http_cache(url, cache_entry)
+
+
+# copy the body of url into destination and return True, or return False if it's the same as the last time
+# the bytes received go to the download stage of source
+def conditional_get(url, destination, source, chunk_size=64 * 1024):
+    with http_cache_lock:
+        cached = load_http_cache().get(url, {}) if http_cache_enabled else {}
+    record_stage(source, "download", bytes=0)  # if nothing (but a 304) comes
+    headers = {}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    try:
+        response_headers, bytes_received = http_client.download(url, destination, headers, chunk_size)
+    except HTTPError as e:
+        if e.code == 304:
+            return False
+        raise
+    record_stage(source, "download", bytes=bytes_received)
+    body_hash = sha256()
+    for chunk in iter(lambda: destination.read(chunk_size), b""):
+        body_hash.update(chunk)
+    destination.seek(0)
+    cache_entry = {"etag": response_headers.get("ETag"), "last_modified": response_headers.get("Last-Modified"),
+                   "sha256": body_hash.hexdigest()}
+    if cache_entry["sha256"] == cached.get("sha256"):
+        # already written, only its validators may have changed
+        if cache_entry != cached:
+            update_http_cache(url, cache_entry)
+        return False
+    with http_cache_lock:
+        pending_http_cache[url] = cache_entry
+    return True
+
+
+# download the raw rates zip into a spooled buffer -- it only touches the disk if it outgrows max_size,
+# and there is no VATSPOTR.zip/VATSPOTR.txt left behind to clean up
+# returns 0 if the file has not changed since the last run and 1 if it could not be downloaded
+def prepare_morocco(VATSPOTR_url, max_size=32 * 1024 * 1024):
+    try:
+        print("Downloading MA rates...")
+        VATSPOTR_zip = SpooledTemporaryFile(max_size=max_size)
+        if not conditional_get(VATSPOTR_url, VATSPOTR_zip, "MA"):
+            print("MA rates have not changed since the last run.\n")
+            VATSPOTR_zip.close()
+            return 0
+        return VATSPOTR_zip
+    except (OSError, HTTPException) as e:
+        print("Oops! Cannot retrieve MA rates from {} ({})\n"
+              "Please ensure your corporate connectivity is working.\n".format(VATSPOTR_url, e))
+        return 1
+
+
+# download the xml into a buffer for the streaming parser
+# returns 0 if the rates have not changed since the last run and 1 if they could not be downloaded
+def download_xml(rates_url, country_abbreviation):
+    try:
+        print("Downloading {} rates...".format(country_abbreviation))
+        rates_xml = BytesIO()
+        if not conditional_get(rates_url, rates_xml, country_abbreviation):
+            print("{} rates have not changed since the last run.\n".format(country_abbreviation))
+            return 0
+        return rates_xml
+    except (OSError, HTTPException) as e:
+        # the client has already retried, so this one is not going to fix itself
+        print("Oops! Cannot retrieve {} rates from {} ({})\n".format(country_abbreviation, rates_url, e))
+        return 1
+
+
+# stream the records of a (large) feed straight off the connection, without waiting for the download to finish
+def stream_xml_records(rates_url, spec):
+    with http_client.get(rates_url) as rates_xml:
+        yield from iter_records(rates_xml, spec)
+
+
+# seconds between two requests to the same host, so that a backfill doesn't hammer the banks' servers
+host_request_interval = 0.25
+host_next_request = {}
+host_request_lock = Lock()
+
+
+def wait_for_host(url):
+    host = urlparse(url).netloc
+    with host_request_lock:
+        now = monotonic()
+        request_time = max(now, host_next_request.get(host, now))
+        host_next_request[host] = request_time + host_request_interval
+    sleep(request_time - now)
@@ -0,0 +1,129 @@
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from zipfile import ZipFile
+
+from upload_rates.downloads import download_xml
+from upload_rates.downloads import prepare_morocco
+from upload_rates.downloads import save_http_cache
+from upload_rates.metrics import measure
+from upload_rates.metrics import record_stage
+from upload_rates.output import batch_written
+from upload_rates.output import generate_output_folder
+from upload_rates.output import write_batch
+from upload_rates.parsing import parse_VATSPOTR_records
+from upload_rates.parsing import parse_VATSPOTR_slices
+from upload_rates.parsing import parse_records
+from upload_rates.parsing import transform_records
+from upload_rates.sources import rate_sources
+
+
+def fetch_VATSPOTR_records(source, spec):
+    with measure(source, "download"):
+        VATSPOTR_zip = prepare_morocco(spec["url"])
+    if VATSPOTR_zip in (0, 1):
+        record_stage(source, "download", failures=VATSPOTR_zip)
+        return VATSPOTR_zip
+    with VATSPOTR_zip:
+        record_stage(source, "download", failures=0)
+        with ZipFile(VATSPOTR_zip) as myzip:
+            decompressed_bytes = myzip.getinfo("VATSPOTR.txt").file_size
+        VATSPOTR_zip.seek(0)
+        with measure(source, "parse"):
+            if spec.get("all_slices"):
+                records = parse_VATSPOTR_slices(VATSPOTR_zip, spec)
+            else:
+                records = parse_VATSPOTR_records(VATSPOTR_zip, spec)
+        record_stage(source, "parse", bytes=decompressed_bytes,
+                     rows=sum(map(len, records.values())) if spec.get("all_slices") else len(records))
+        return records
+
+
+def fetch_xml_records(source, spec, rates_date):
+    with measure(source, "download"):
+        rates_xml = download_xml(spec["url"].format(date=rates_date), source)
+    if rates_xml in (0, 1):
+        record_stage(source, "download", failures=rates_xml)
+        return rates_xml
+    record_stage(source, "download", failures=0)
+    with measure(source, "parse"):
+        records = parse_records(rates_xml, spec)
+    record_stage(source, "parse", rows=len(records))
+    return records
+
+
+def VATSPOTR_slice_spec(spec, rate_type, base_cur):
+    return {"output_name": "VATSPOTR_{}_{}".format(rate_type, base_cur), "header": spec["header"],
+            "source_tag": "SOURCE=VATSPOTR-{}-{}".format(rate_type, base_cur), "base_currency": base_cur,
+            "date_format": spec["date_format"], "formats": spec.get("formats", ["xlsx"])}
+
+
+# the source's own slice is written as usual, every other one as a batch of its own, e.g. VATSPOTR_CBCUR_DKK_RATES_...
+# with a render pool, the slices are handed to it from threads of their own, so that they render side by side
+# returns the source's own batch and whether every slice was written
+def generate_VATSPOTR_slices(source, spec, slices, destination_folder, formats=None, delta=False):
+    from upload_rates import output
+
+    source_data = None
+    with ThreadPoolExecutor(max_workers=8 if output.render_pool else 1) as executor:
+        futures = []
+        for (rate_type, base_cur), records in slices.items():
+            if (rate_type, base_cur) == (spec["rate_type"], spec["base_currency"]):
+                batch_name, batch_spec = source, spec
+            else:
+                batch_name = "VATSPOTR {} {}".format(rate_type, base_cur)
+                batch_spec = VATSPOTR_slice_spec(spec, rate_type, base_cur)
+            if records.empty:
+                continue
+            with measure(batch_name, "transform"):
+                data = transform_records(records, batch_spec, batch_name)
+            record_stage(batch_name, "transform", rows=len(data))
+            futures.append(executor.submit(write_batch, batch_name, data, destination_folder, formats, delta,
+                                           batch_spec))
+            if batch_name == source:
+                source_data = data
+        written = all([batch_written(future.result()) for future in futures])
+    return source_data, written
+
+
+# returns the batch (None if there was nothing new, or nothing at all) and whether it was written
+# the feed is only remembered in the HTTP cache once its batch is written, so a batch that is held back or can't be
+# written is generated again by the next run
+def generate_source(source, rates_date=None, destination_folder=None, formats=None, delta=False):
+    from upload_rates import output
+
+    spec = rate_sources[source]
+    rates_date = rates_date or datetime.now()
+    rates_url = spec["url"].format(date=rates_date)
+    if spec.get("format") == "VATSPOTR":
+        records = fetch_VATSPOTR_records(source, spec)
+    else:
+        records = fetch_xml_records(source, spec, rates_date)
+    if isinstance(records, int):  # 0 - nothing new, 1 - the download failed
+        return None, False
+    if isinstance(records, dict):  # every slice of the VATSPOTR extract
+        data, written = generate_VATSPOTR_slices(source, spec, records,
+                                                 destination_folder or generate_output_folder(), formats, delta)
+    else:
+        with measure(source, "transform"):
+            data = transform_records(records, spec, source)
+        record_stage(source, "transform", rows=len(data))
+        written = batch_written(write_batch(source, data, destination_folder or generate_output_folder(), formats,
+                                            delta))
+    if written and output.daily_workbook is not None and source in output.daily_workbook.batches:
+        output.daily_workbook.add_url(rates_url)  # once the workbook is saved
+    elif written:
+        save_http_cache(rates_url)
+    return data, written
+
+
+# run every source in its own worker -- each one downloads, parses and writes its file as soon as its own
+# payload arrives, so the whole run takes about as long as the slowest feed instead of the sum of all of them
+def generate_all(sources, max_workers=6, formats=None, delta=False):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(generate_source, source, formats=formats, delta=delta): source for source in sources}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print("{} crashed: {}\n".format(futures[future], e))
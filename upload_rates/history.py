@@ -0,0 +1,110 @@
+from contextlib import closing
+from threading import Lock
+import sqlite3
+
+
+# every generated batch is also appended to a local SQLite store, so that questions like "what was the PLN/EUR rate
+# last March" are a single indexed query instead of opening dozens of workbooks
+# the primary key clusters the rows by (source, currency, effective date), i.e. each source is its own partition
+history_path = "Rates\\rates_history.sqlite"
+history_lock = Lock()
+
+
+def connect_to_history(history_location=None):
+    connection = sqlite3.connect(history_location or history_path, timeout=30)
+    connection.execute("""CREATE TABLE IF NOT EXISTS rates (
+                              source TEXT NOT NULL,
+                              base_currency TEXT NOT NULL,
+                              foreign_currency TEXT NOT NULL,
+                              effective_date TEXT NOT NULL,
+                              rate REAL NOT NULL,
+                              PRIMARY KEY (source, foreign_currency, effective_date, base_currency)
+                          ) WITHOUT ROWID""")
+    connection.execute("CREATE INDEX IF NOT EXISTS rates_by_currency ON rates (foreign_currency, effective_date)")
+    return connection
+
+
+# data is the output batch: base currency, foreign currency, effective date, rate
+# re-running a day replaces its rows instead of duplicating them
+def append_to_history(data, source, history_location=None):
+    rows = [(source, base_cur, foreign_cur, effective_date.strftime("%Y-%m-%d"), float(rate))
+            for base_cur, foreign_cur, effective_date, rate in data.itertuples(index=False)]
+    with history_lock, closing(connect_to_history(history_location)) as connection, connection:
+        connection.executemany("INSERT OR REPLACE INTO rates VALUES (?, ?, ?, ?, ?)", rows)
+
+
+# e.g. read_history(source="PL A", foreign_cur="EUR", start_date="2017-03-01", end_date="2017-03-31")
+def read_history(source=None, foreign_cur=None, start_date=None, end_date=None, history_location=None):
+    conditions = []
+    parameters = []
+    # the dates may be strings, datetimes or Timestamps, all of them start with YYYY-MM-DD
+    start_date = None if start_date is None else str(start_date)[:10]
+    end_date = None if end_date is None else str(end_date)[:10]
+    for condition, parameter in [("source = ?", source), ("foreign_currency = ?", foreign_cur),
+                                 ("effective_date >= ?", start_date), ("effective_date <= ?", end_date)]:
+        if parameter is not None:
+            conditions.append(condition)
+            parameters.append(parameter)
+    query = "SELECT * FROM rates"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY source, foreign_currency, effective_date"
+    from pandas import read_sql_query
+
+    with closing(connect_to_history(history_location)) as connection:
+        history = read_sql_query(query, connection, params=parameters, parse_dates=["effective_date"])
+    return history
+
+
+# the latest effective date and the number of rows per source, without pulling in pandas
+def history_status(history_location=None):
+    with closing(connect_to_history(history_location)) as connection:
+        return connection.execute("SELECT source, MAX(effective_date), COUNT(*) FROM rates GROUP BY source").fetchall()
+
+
+# the latest rate of every foreign currency the source has ever had (base currency, foreign currency, effective date,
+# rate), None if it has none yet -- per currency, since a batch may mix effective dates (e.g. a VATSPOTR slice with a
+# currency the bank hasn't fixed for years)
+# batch_dates: {foreign currency: effective date} of a new batch, to get each of its currencies' latest rate before its
+# own date instead (and the other currencies' before the batch's latest date); a currency with none gets NaN
+def read_previous_rates(source, batch_dates=None, history_location=None):
+    from pandas import read_sql_query
+
+    batch_dates = {foreign_cur: str(effective_date)[:10] for foreign_cur, effective_date in (batch_dates or {}).items()}
+    batch_values = ", ".join(["(?, ?)"] * len(batch_dates)) or "(NULL, NULL)"
+    latest_date = max(batch_dates.values(), default="9999-12-31")
+    with history_lock, closing(connect_to_history(history_location)) as connection:
+        previous_rates = read_sql_query("""WITH batch (foreign_currency, effective_date) AS (VALUES {}),
+                                           previous AS (
+                                               SELECT known.foreign_currency, (
+                                                   SELECT MAX(effective_date) FROM rates
+                                                   WHERE source = ? AND foreign_currency = known.foreign_currency
+                                                   AND effective_date < COALESCE(batch.effective_date, ?)
+                                               ) AS effective_date
+                                               FROM (SELECT DISTINCT foreign_currency FROM rates WHERE source = ?) known
+                                               LEFT JOIN batch USING (foreign_currency)
+                                           )
+                                           SELECT rates.base_currency, previous.foreign_currency,
+                                                  previous.effective_date, rates.rate
+                                           FROM previous LEFT JOIN rates
+                                           ON rates.source = ? AND rates.foreign_currency = previous.foreign_currency
+                                           AND rates.effective_date = previous.effective_date""".format(batch_values),
+                                        connection, parse_dates=["effective_date"],
+                                        params=[value for pair in batch_dates.items() for value in pair] +
+                                               [source, latest_date, source, source])
+    if previous_rates.empty:
+        return None
+    return previous_rates.set_axis([0, 1, 2, 3], axis=1)
+
+
+# every source's rows of its latest effective date
+def read_latest_history(history_location=None):
+    from pandas import read_sql_query
+
+    with closing(connect_to_history(history_location)) as connection:
+        latest = read_sql_query("""SELECT rates.* FROM rates
+                                   JOIN (SELECT source, MAX(effective_date) AS effective_date FROM rates
+                                         GROUP BY source)
+                                   USING (source, effective_date)
+                                   ORDER BY source, foreign_currency""", connection, parse_dates=["effective_date"])
+    return latest
@@ -0,0 +1,166 @@
+# a small HTTP/JSON rate lookup service over the rate history, for the internal tools that used to open the generated
+# workbooks just to read one rate:
+#
+# python -m upload_rates.lookup_server --port 8790
+# GET /rate?base=TRY&foreign=EUR                    the latest rate
+# GET /rate?base=PLN&foreign=EUR&date=2017-03-01    the rate effective on that date (or the last one before it)
+# GET /latest?base=PLN                              every latest rate, optionally of one base currency
+#
+# the latest rate of every pair is kept in memory, from the latest batch of every source, and the lookups of a date
+# go through a bounded LRU cache in front of the SQLite history -- both are dropped and rebuilt whenever the
+# history changes (e.g. a run or the daemon wrote a new batch), which costs one stat per request to notice
+# when several sources have the same pair on the same effective date, the first of them in the registry (sources.py)
+# answers, and the sources outside it (the VATSPOTR slices) come after, by name
+from argparse import ArgumentParser
+from contextlib import closing
+from datetime import date
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from os.path import getmtime
+from threading import Lock
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+import json
+
+from upload_rates.history import connect_to_history
+from upload_rates.history import history_path
+from upload_rates.history import read_latest_history
+from upload_rates.sources import rate_sources
+
+
+def source_priority(source):
+    registry = list(rate_sources)
+    return (0, registry.index(source), "") if source in registry else (1, 0, source)
+
+
+class RateIndex:
+    def __init__(self, history_location=None, cache_size=4096):
+        self.history_location = history_location or history_path
+        self.lock = Lock()
+        self.loaded_version = None
+        # the latest rate of every pair, from the latest batches: {(base, foreign): (effective date, rate, source)}
+        self.latest_rates = {}
+        self.lookup_history = lru_cache(maxsize=cache_size)(self.query_history)
+
+    # without a history yet, there's nothing to answer with
+    def refresh(self):
+        try:
+            version = getmtime(self.history_location)
+        except FileNotFoundError:
+            version = None
+        if version == self.loaded_version:
+            return
+        with self.lock:
+            if version == self.loaded_version:
+                return
+            latest_rates = {}
+            if version is not None:
+                for source, base_cur, foreign_cur, effective_date, rate in read_latest_history(
+                        self.history_location).itertuples(index=False):
+                    # the same pair from two sources: the later effective date wins, then the source priority
+                    effective_date = effective_date.strftime("%Y-%m-%d")
+                    latest = latest_rates.get((base_cur, foreign_cur))
+                    if latest is None or effective_date > latest[0] or (
+                            effective_date == latest[0] and source_priority(source) < source_priority(latest[2])):
+                        latest_rates[base_cur, foreign_cur] = (effective_date, rate, source)
+            self.latest_rates = latest_rates
+            self.lookup_history.cache_clear()
+            self.loaded_version = version
+
+    # returns (rate, source, effective date), or None
+    def query_history(self, base_cur, foreign_cur, rates_date):
+        with closing(connect_to_history(self.history_location)) as connection:
+            rows = connection.execute("""SELECT rate, source, effective_date FROM rates
+                                         WHERE foreign_currency = ? AND base_currency = ? AND effective_date = (
+                                             SELECT MAX(effective_date) FROM rates
+                                             WHERE foreign_currency = ? AND base_currency = ? AND effective_date <= ?
+                                         )""", (foreign_cur, base_cur, foreign_cur, base_cur, rates_date)).fetchall()
+        return min(rows, key=lambda row: source_priority(row[1])) if rows else None
+
+    # returns (rate, source, effective date), or None
+    def lookup(self, base_cur, foreign_cur, rates_date=None):
+        self.refresh()
+        if rates_date is None:
+            if (base_cur, foreign_cur) not in self.latest_rates:
+                return None
+            effective_date, rate, source = self.latest_rates[base_cur, foreign_cur]
+            return rate, source, effective_date
+        # always from the history, so that a date is answered by the same source whichever batch it's in
+        if self.loaded_version is None:  # no history yet
+            return None
+        return self.lookup_history(base_cur, foreign_cur, rates_date)
+
+    def latest(self, base_cur=None):
+        self.refresh()
+        return [{"base": base, "foreign": foreign, "effective_date": effective_date, "rate": rate, "source": source}
+                for (base, foreign), (effective_date, rate, source) in sorted(self.latest_rates.items())
+                if base_cur is None or base == base_cur]
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # the headers and the body go out in separate writes, don't let Nagle hold the body back for the delayed ACK
+    disable_nagle_algorithm = True
+
+    def send_json(self, status, answer):
+        body = json.dumps(answer).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {parameter: values[0] for parameter, values in parse_qs(url.query).items()}
+        rate_index = self.server.rate_index
+        if url.path == "/latest":
+            self.send_json(200, rate_index.latest(query.get("base", "").upper() or None))
+        elif url.path == "/rate":
+            if "base" not in query or "foreign" not in query:
+                self.send_json(400, {"error": "base and foreign are required, e.g. /rate?base=TRY&foreign=EUR"})
+                return
+            base_cur, foreign_cur = query["base"].upper(), query["foreign"].upper()
+            if "date" in query:
+                # compared as a string in SQL, so it has to be a real date, written the same way as the history's
+                try:
+                    query["date"] = date.fromisoformat(query["date"]).isoformat()
+                except ValueError:
+                    self.send_json(400, {"error": "date must be YYYY-MM-DD, e.g. 2017-03-01"})
+                    return
+            found = rate_index.lookup(base_cur, foreign_cur, query.get("date"))
+            if found is None:
+                self.send_json(404, {"error": "no {} per {} rate{}".format(
+                    base_cur, foreign_cur, " on or before " + query["date"] if "date" in query else "")})
+                return
+            rate, source, effective_date = found
+            self.send_json(200, {"base": base_cur, "foreign": foreign_cur, "effective_date": effective_date,
+                                 "rate": rate, "source": source})
+        else:
+            self.send_json(404, {"error": "try /rate or /latest"})
+
+    # one line per request is too much for a service answering in microseconds
+    def log_message(self, format, *args):
+        pass
+
+
+def main(argv=None):
+    parser = ArgumentParser(prog="upload_rates.lookup_server", description="Serve the rate history as JSON.")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--history", default=history_path, help="the rate history (default {})".format(history_path))
+    parser.add_argument("--cache-size", type=int, default=4096, help="historical lookups kept in memory")
+    args = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer(("localhost", args.port), LookupHandler)
+    server.rate_index = RateIndex(args.history, args.cache_size)
+    server.rate_index.refresh()
+    print("Serving the rates of {} on http://localhost:{}/, Ctrl+C to stop".format(args.history, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# where the time of a run goes: the download, parse, transform and write stages of every source record their wall time
+# and what went through them (bytes, rows), and --metrics exports the latest values as a JSON run report and as a
+# Prometheus textfile (for node_exporter's textfile collector), e.g. to alert when the ECB or the CBR get slow
+# the zip and gzip decompression is streamed inside the parse and download stages, and the Excel dates are formatted
+# while the rows are written, so neither is a stage of its own -- the download stages report the bytes received (still
+# gzipped, if they came gzipped) and the parse stage of MA the decompressed bytes
+from contextlib import contextmanager
+from datetime import datetime
+from os import makedirs
+from os import replace
+from os.path import join
+from threading import Lock
+from time import perf_counter
+from time import time
+import json
+import tracemalloc
+
+from upload_rates.profiling import profile_stage
+
+# {(source, stage): {"seconds": ..., "bytes": ..., "rows": ..., "failures": ..., "timestamp": ...}}
+# a stage that runs again (e.g. in the daemon) replaces its previous values
+stage_metrics = {}
+stage_metrics_lock = Lock()
+run_started = time()
+
+# --metrics traces the allocations, so that every stage reports its peak memory on every platform (Windows has no
+# resident set peak) -- tracemalloc slows the allocations down, so only when the metrics are asked for
+memory_tracing = False
+# {an open stage: (traced bytes at its start, the highest traced bytes seen since)}
+# the stages of the sources overlap and tracemalloc has a single peak, so at every start and end of a stage the peak so
+# far is handed to all the open stages and reset
+open_stages = {}
+open_stages_lock = Lock()
+# the peak of the whole run, across the resets
+traced_peak_bytes = 0
+
+
+def start_memory_tracing():
+    global memory_tracing
+    memory_tracing = True
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def fold_memory_peak():
+    global traced_peak_bytes
+    peak = tracemalloc.get_traced_memory()[1]
+    traced_peak_bytes = max(traced_peak_bytes, peak)
+    for open_stage, (start_bytes, highest_bytes) in open_stages.items():
+        open_stages[open_stage] = (start_bytes, max(highest_bytes, peak))
+    tracemalloc.reset_peak()
+
+
+def record_stage(source, stage, **values):
+    with stage_metrics_lock:
+        stage_metrics.setdefault((source, stage), {}).update(values, timestamp=time())
+
+
+# and profiles the stage if --profile asks for it
+# with memory_tracing, peak_memory_bytes is how far the traced memory rose above its level at the start of the stage
+# -- the stages of other sources running at the same time count too
+@contextmanager
+def measure(source, stage):
+    open_stage = object()
+    if memory_tracing:
+        with open_stages_lock:
+            fold_memory_peak()
+            traced_bytes = tracemalloc.get_traced_memory()[0]
+            open_stages[open_stage] = (traced_bytes, traced_bytes)
+    start = perf_counter()
+    try:
+        with profile_stage(source, stage):
+            yield
+    finally:
+        values = {"seconds": perf_counter() - start}
+        if memory_tracing:
+            with open_stages_lock:
+                fold_memory_peak()
+                start_bytes, highest_bytes = open_stages.pop(open_stage)
+            values["peak_memory_bytes"] = highest_bytes - start_bytes
+        record_stage(source, stage, **values)
+
+
+# the peak of the process' memory -- the resident set where the OS tells it (not on Windows), otherwise what
+# tracemalloc has seen if it's tracing (--metrics or python -X tracemalloc), otherwise None
+def peak_memory_bytes():
+    try:
+        from resource import RUSAGE_SELF
+        from resource import getrusage
+        from sys import platform
+
+        max_rss = getrusage(RUSAGE_SELF).ru_maxrss
+        return max_rss if platform == "darwin" else max_rss * 1024
+    except ImportError:
+        if tracemalloc.is_tracing():
+            with open_stages_lock:
+                return max(traced_peak_bytes, tracemalloc.get_traced_memory()[1])
+        return None
+
+
+def run_report():
+    with stage_metrics_lock:
+        stages = [dict(values, source=source, stage=stage) for (source, stage), values in sorted(stage_metrics.items())]
+    return {"started": datetime.fromtimestamp(run_started).isoformat(), "finished": datetime.now().isoformat(),
+            "seconds": time() - run_started, "peak_memory_bytes": peak_memory_bytes(), "stages": stages}
+
+
+def prometheus_text(report):
+    lines = []
+    for metric, key, description in [("upload_rates_stage_duration_seconds", "seconds", "Wall time of the stage."),
+                                     ("upload_rates_stage_bytes", "bytes", "Bytes that went through the stage."),
+                                     ("upload_rates_stage_rows", "rows", "Rows that went through the stage."),
+                                     ("upload_rates_stage_failures", "failures", "1 if the stage failed."),
+                                     ("upload_rates_stage_peak_memory_bytes", "peak_memory_bytes",
+                                      "Peak traced memory of the stage above its start."),
+                                     ("upload_rates_stage_timestamp_seconds", "timestamp", "When the stage last ran.")]:
+        lines += ["# HELP {} {}".format(metric, description), "# TYPE {} gauge".format(metric)]
+        for stage in report["stages"]:
+            if stage.get(key) is not None:
+                lines.append('{}{{source="{}",stage="{}"}} {}'.format(metric, stage["source"], stage["stage"],
+                                                                       stage[key]))
+    lines += ["# HELP upload_rates_run_duration_seconds Wall time of the run so far.",
+              "# TYPE upload_rates_run_duration_seconds gauge",
+              "upload_rates_run_duration_seconds {}".format(report["seconds"])]
+    if report["peak_memory_bytes"] is not None:
+        lines += ["# HELP upload_rates_peak_memory_bytes Peak memory of the process.",
+                  "# TYPE upload_rates_peak_memory_bytes gauge",
+                  "upload_rates_peak_memory_bytes {}".format(report["peak_memory_bytes"])]
+    return "\n".join(lines) + "\n"
+
+
+# run_<start time>.json and upload_rates.prom, which is replaced in one go so the collector never reads half of it
+def write_metrics(metrics_folder):
+    report = run_report()
+    makedirs(metrics_folder, exist_ok=True)
+    report_name = "run_{}.json".format(datetime.fromtimestamp(run_started).strftime("%Y-%m-%d_%H%M%S"))
+    with open(join(metrics_folder, report_name), "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    with open(join(metrics_folder, "upload_rates.prom.tmp"), "w") as prometheus_file:
+        prometheus_file.write(prometheus_text(report))
+    replace(join(metrics_folder, "upload_rates.prom.tmp"), join(metrics_folder, "upload_rates.prom"))
@@ -0,0 +1,278 @@
+# pandas and openpyxl are only imported once there is something to write
+from datetime import datetime
+from os.path import exists
+from os import makedirs
+from threading import Lock
+
+from upload_rates.history import append_to_history
+from upload_rates.history import read_previous_rates
+from upload_rates.metrics import measure
+from upload_rates.metrics import record_stage
+from upload_rates import validation
+from upload_rates.sources import rate_sources
+
+
+def generate_output_folder(rates_date=None):
+    today_date = (rates_date or datetime.now()).strftime("%Y-%m-%d")
+    destination_folder = "Rates\\" + today_date + "_rates"  # e.g. Rates\2017-04-04_rates
+    if not exists(destination_folder):
+        makedirs(destination_folder)
+    return destination_folder
+
+
+# source_tag overrides the tag of country_abbreviation, e.g. for the VATSPOTR slices
+def generate_header(country_abbreviation, source_tag=None):
+    from pandas import DataFrame
+
+    header = DataFrame([["CURRENCY_RATES", "COMPANY_ID=HP", "", ""],
+                       ["BASE_CURRENCY", "FOREIGN_CURRENCY", "EFFECTIVE_DATE", "RATE"]])
+    sources = {"MA": "SOURCE=BOM-MAD", "TR": "SOURCE=TNB-TRY", "SK": "SOURCE=ECB-EUR",
+               "RU": "SOURCE=NBR-RUB", "PL": "SOURCE=PNB-PLN"}
+    header.iloc[0, 2] = source_tag or sources[country_abbreviation]
+    return header
+
+
+# a write-only workbook whose effective dates all share one named cell style
+# use openpyxl's builtin number formats for output_date_format
+def rates_workbook(output_date_format="mm-dd-yy"):
+    from openpyxl import Workbook
+    from openpyxl.styles import NamedStyle
+
+    wb = Workbook(write_only=True)
+    wb.add_named_style(NamedStyle(name="effective_date", number_format=output_date_format))
+    return wb
+
+
+def append_rates_sheet(wb, sheet_name, header, data):
+    from openpyxl.cell import WriteOnlyCell
+
+    ws = wb.create_sheet(sheet_name)
+    for header_row in header.itertuples(index=False):
+        # a blank header cell is left out, as pandas did, instead of being written as an empty string
+        ws.append([None if value == "" else value for value in header_row])
+    for data_row in data.itertuples(index=False):
+        base_cur, foreign_cur, effective_date, rate = data_row
+        date_cell = WriteOnlyCell(ws, value=effective_date.to_pydatetime())
+        date_cell.style = "effective_date"
+        ws.append([base_cur, foreign_cur, date_cell, float(rate)])
+
+
+# write the header, the data and the date formats in a single pass with openpyxl's write-only mode,
+# so the workbook never has to be loaded back just to turn the bare dates into an Excel Date type
+# every writer returns whether it wrote the file, and only speaks up if it couldn't (see render_output)
+def generate_excel_output(header, data, output_path, country_abbreviation, output_date_format="mm-dd-yy"):
+    try:
+        wb = rates_workbook(output_date_format)
+        append_rates_sheet(wb, "Sheet1", header, data)
+        wb.save(output_path)
+        return True
+    except:
+        print("Unable to generate {} rates. :(\n".format(country_abbreviation))
+        return False
+
+
+# the other formats only carry the four columns, under their upload names -- the CURRENCY_RATES header block is an
+# xlsx upload thing
+output_columns = ["BASE_CURRENCY", "FOREIGN_CURRENCY", "EFFECTIVE_DATE", "RATE"]
+
+
+def generate_csv_output(header, data, output_path, country_abbreviation):
+    try:
+        data.set_axis(output_columns, axis=1).to_csv(output_path, index=False, date_format="%Y-%m-%d")
+        return True
+    except OSError:
+        print("Unable to generate {} rates as CSV. :(\n".format(country_abbreviation))
+        return False
+
+
+# needs pyarrow (or fastparquet)
+def generate_parquet_output(header, data, output_path, country_abbreviation):
+    try:
+        data.set_axis(output_columns, axis=1).to_parquet(output_path, index=False)
+        return True
+    except ImportError:
+        print("Unable to generate {} rates as Parquet: please install pyarrow. :(\n".format(country_abbreviation))
+        return False
+    except OSError:
+        print("Unable to generate {} rates as Parquet. :(\n".format(country_abbreviation))
+        return False
+
+
+def batch_to_arrow(data):
+    from pyarrow import Table
+
+    return Table.from_pandas(data.set_axis(output_columns, axis=1), preserve_index=False)
+
+
+# an uncompressed Arrow IPC (Feather v2) file, so that in-process consumers can memory-map it and read the batch
+# without copying it -- see read_arrow_output
+# needs pyarrow
+def generate_arrow_output(header, data, output_path, country_abbreviation):
+    try:
+        from pyarrow import feather
+
+        feather.write_feather(batch_to_arrow(data), output_path, compression="uncompressed")
+        return True
+    except ImportError:
+        print("Unable to generate {} rates as Arrow: please install pyarrow. :(\n".format(country_abbreviation))
+        return False
+    except OSError:
+        print("Unable to generate {} rates as Arrow. :(\n".format(country_abbreviation))
+        return False
+
+
+# a zero-copy view of a batch written by generate_arrow_output
+def read_arrow_output(output_path):
+    from pyarrow import ipc
+    from pyarrow import memory_map
+
+    return ipc.open_file(memory_map(output_path, "r")).read_all()
+
+
+# format: (writer, file extension, what the success message calls it)
+output_writers = {"xlsx": (generate_excel_output, ".xlsx", ""), "csv": (generate_csv_output, ".csv", " as CSV"),
+                  "parquet": (generate_parquet_output, ".parquet", " as Parquet"),
+                  "arrow": (generate_arrow_output, ".arrow", " as Arrow")}
+
+
+# the rows of the batch that are new or have another rate than the latest one of their currency (read_previous_rates)
+# (a re-published batch under a new effective date has no changed rows at all)
+def changed_rows(data, previous_batch):
+    if previous_batch is None:
+        return data
+    previous_rates = previous_batch.set_index([0, 1])[3]
+    rates_before = previous_rates.reindex(list(zip(data[0], data[1]))).to_numpy()
+    return data[rates_before != data[3].to_numpy()].reset_index(drop=True)
+
+
+# --consolidated: instead of a workbook per source, the day's batches are collected and written as the sheets of a
+# single workbook at the end of the run, in one writer session -- for the teams that upload one daily pack
+class DailyWorkbook:
+    def __init__(self):
+        self.batches = {}
+        # the feeds of the batches, only remembered in the HTTP cache once the workbook is saved
+        self.urls = []
+        self.lock = Lock()
+
+    def add(self, source, header, data):
+        with self.lock:
+            self.batches[source] = (header, data)
+
+    def add_url(self, url):
+        with self.lock:
+            self.urls.append(url)
+
+    # the sources of the registry first, in its order, then the rest (e.g. the VATSPOTR slices)
+    def save(self, output_path, output_date_format="mm-dd-yy"):
+        from upload_rates.downloads import save_http_cache
+
+        if not self.batches:
+            return
+        sources = [source for source in rate_sources if source in self.batches]
+        sources += sorted(source for source in self.batches if source not in rate_sources)
+        try:
+            with measure("DAILY", "write_xlsx"):
+                wb = rates_workbook(output_date_format)
+                for source in sources:
+                    append_rates_sheet(wb, source[:31], *self.batches[source])
+                wb.save(output_path)
+            record_stage("DAILY", "write_xlsx", rows=sum(len(data) for _header, data in self.batches.values()))
+            print("Daily workbook of {} sources generated to {} :)\n".format(len(sources), output_path))
+            for url in self.urls:
+                save_http_cache(url)
+        except OSError:
+            print("Unable to generate the daily workbook {}. :(\n".format(output_path))
+
+
+daily_workbook = None
+
+
+# --render-processes: openpyxl's XML serialisation is CPU-bound and holds the GIL, so with many batches per run the
+# writers go to a pool of processes -- the workers get the header and the batch, and return the path they wrote to
+render_pool = None
+
+
+# returns the path written to, or None if the file couldn't be written
+# announce: print that the rates were generated, not for the held batches
+def render_output(output_format, header, data, output_path, source, announce=True):
+    writer, extension, format_name = output_writers[output_format]
+    if not writer(header, data, output_path + extension, source):
+        return None
+    if announce:
+        print("{} rates generated{} :)\n".format(source, format_name))
+    return output_path + extension
+
+
+# whether write_batch wrote every file of the batch, i.e. it wasn't held back and no format failed
+def batch_written(output_paths):
+    return output_paths is not None and None not in output_paths
+
+
+# the batch and its issues go to the held subfolder, where nothing picks them up for the upload
+def hold_batch(source, data, destination_folder, issues, formats, spec):
+    held_folder = destination_folder + "\\held"
+    makedirs(held_folder, exist_ok=True)
+    output_path = held_folder + "\\" + spec["output_name"] + "_RATES_" + str(data.iloc[0, 2])[:-9]
+    issues.to_csv(output_path + "_issues.csv", index=False)
+    header = generate_header(spec["header"], spec.get("source_tag"))
+    output_paths = [render_output(output_format, header, data, output_path, source, announce=False)
+                    for output_format in formats or spec.get("formats", ["xlsx"])] + [output_path + "_issues.csv"]
+    print("{} rates held back to {}, {} issue(s) against the previous rates: {} :|\n".format(
+        source, held_folder, len(issues), ", ".join(issues["FOREIGN_CURRENCY"] + " " + issues["ISSUE"])))
+    return output_paths
+
+
+# formats defaults to the source's "formats" in the registry, xlsx if it has none
+# delta: only write the rows that changed since the source's last batch in the history, and nothing if none did --
+# the history still gets the whole batch
+# spec: for the batches that aren't a source of the registry, e.g. the VATSPOTR slices
+# validate: check the batch against the previous rates of its currencies first (see validation.py) -- a batch that
+# fails is written to the held subfolder with its issues instead, and is kept out of the history
+# returns the paths of the files written (None for a format that couldn't be written), or None if the batch was held
+def write_batch(source, data, destination_folder, formats=None, delta=False, spec=None, validate=True):
+    from upload_rates import upload  # the upload pulls in the HTTP client, keep it out of importing cli
+
+    spec = spec or rate_sources[source]
+    if validate and validation.validation_enabled:
+        with measure(source, "validate"):
+            issues, held = validation.validate_batch(data, read_previous_rates(source, dict(zip(data[1], data[2]))),
+                                                     validation.validation_thresholds(spec))
+        record_stage(source, "validate", rows=len(issues), failures=int(held))
+        if held:
+            hold_batch(source, data, destination_folder, issues, formats, spec)
+            return None
+    if delta:
+        full_batch, data = data, changed_rows(data, read_previous_rates(source))
+        if data.empty:
+            print("{} rates have not changed since the last batch.\n".format(source))
+            append_to_history(full_batch, source)
+            return []
+        print("{} rates: {} of {} changed since the last batch.".format(source, len(data), len(full_batch)))
+    # extract the rates' effective date for output file and the file's name
+    effective_date = data.iloc[0, 2]
+    output_path = destination_folder + "\\" + spec["output_name"] + "_RATES_" + str(effective_date)[:-9]
+    header = generate_header(spec["header"], spec.get("source_tag"))
+    output_formats = formats or spec.get("formats", ["xlsx"])
+    if daily_workbook is not None and "xlsx" in output_formats:
+        # the batch becomes a sheet of the daily workbook instead of a workbook of its own
+        daily_workbook.add(source, header, data)
+        output_formats = [output_format for output_format in output_formats if output_format != "xlsx"]
+    if render_pool:
+        # all the formats are rendered at once, so a format's time is until its file is there
+        rendered = [render_pool.submit(render_output, output_format, header, data, output_path, source)
+                    for output_format in output_formats]
+    else:
+        rendered = output_formats
+    output_paths = []
+    for output_format, rendering in zip(output_formats, rendered):
+        with measure(source, "write_" + output_format):
+            if render_pool:
+                output_paths.append(rendering.result())
+            else:
+                output_paths.append(render_output(output_format, header, data, output_path, source))
+        record_stage(source, "write_" + output_format, rows=len(data))
+    with measure(source, "history"):
+        append_to_history(full_batch if delta else data, source)
+    if upload.upload_queue is not None:
+        upload.upload_queue.add(source, header.iloc[0, 2], data)
+    return output_paths
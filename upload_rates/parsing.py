@@ -0,0 +1,129 @@
+# pandas is only imported by the stages that build DataFrames, so that importing the package stays cheap
+import xml.etree.ElementTree as ElementTree
+
+from upload_rates.currencies import translate_currencies
+from upload_rates.vatspotr import VATSPOTRIndex
+
+
+# the extract is indexed by rate type/base currency in one scan (see vatspotr.py), so only the lines of the requested
+# slice are ever tokenised into DataFrame rows
+def read_VATSPOTR(VATSPOTR_zip, rate_type, base_cur, cur_in_scope):
+    with VATSPOTRIndex(VATSPOTR_zip) as VATSPOTR:
+        return VATSPOTR.read(rate_type, base_cur, cur_in_scope)
+
+
+def VATSPOTR_records(VATSPOTR_slice):
+    from pandas import DataFrame
+
+    return DataFrame({"currency": VATSPOTR_slice[3], "effective_date": VATSPOTR_slice[4],
+                      "rate": VATSPOTR_slice[7], "normalizer": VATSPOTR_slice[8], "quote": VATSPOTR_slice[6]})
+
+
+# only the rows in scope come out as records
+def parse_VATSPOTR_records(VATSPOTR_zip, spec):
+    return VATSPOTR_records(read_VATSPOTR(VATSPOTR_zip, spec["rate_type"], spec["base_currency"],
+                                          spec["cur_in_scope"]))
+
+
+# the records of every (rate type, base currency) slice of the extract, all cut out of the one index:
+# {(rate type, base currency): records}, the source's own slice with only its cur_in_scope
+def parse_VATSPOTR_slices(VATSPOTR_zip, spec):
+    with VATSPOTRIndex(VATSPOTR_zip) as VATSPOTR:
+        VATSPOTR_slices = VATSPOTR.read_slices()
+    slices = {}
+    for (rate_type, base_cur), VATSPOTR_slice in VATSPOTR_slices.items():
+        if (rate_type, base_cur) == (spec["rate_type"], spec["base_currency"]):
+            VATSPOTR_slice = VATSPOTR_slice[VATSPOTR_slice[3].isin(spec["cur_in_scope"])].reset_index(drop=True)
+        slices[rate_type, base_cur] = VATSPOTR_records(VATSPOTR_slice)
+    return slices
+
+
+# strip the {namespace} ElementTree prepends to the tags of namespaced documents such as the ECB's
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+# "Tag" - the text of the element's child Tag, "@attr" - the element's own attribute
+def read_field(element, field):
+    tag, _, attribute = field.partition("@")
+    if tag:
+        element = next((child for child in element if local_name(child.tag) == tag), None)
+        if element is None:
+            return None
+    return element.get(attribute) if attribute else element.text
+
+
+# parse the feed incrementally and yield a (currency, effective date, rate, normalizer) record as soon as its
+# element is complete
+# every element is dropped once it's been read, so only the currently open path stays in memory -- the memory use is
+# flat whether it's today's 30 rates or twenty years of eurofxref-hist.xml, and the parse can run off a live download
+def iter_records(rates_xml, spec):
+    date_tag, _, date_attribute = spec["date"].partition("@")
+    record_tag = spec["record"]
+    # with an attribute it's known at the start of an element whether it's a record, e.g. the ECB's outer Cube
+    # elements have no currency and are just containers
+    record_attribute = spec["currency"][1:] if spec["currency"].startswith("@") else None
+    effective_date = None
+    open_elements = []
+    open_records = 0
+    number_of_records = 0
+    for event, element in ElementTree.iterparse(rates_xml, events=("start", "end")):
+        tag = local_name(element.tag)
+        is_record = tag == record_tag and (record_attribute is None or record_attribute in element.attrib)
+        if event == "start":
+            open_elements.append(element)
+            open_records += is_record
+            if date_attribute and tag == date_tag and date_attribute in element.attrib:
+                effective_date = element.get(date_attribute)
+            continue
+
+        open_elements.pop()
+        if not date_attribute and tag == date_tag:
+            effective_date = element.text
+        if is_record:
+            open_records -= 1
+            currency = read_field(element, spec["currency"])
+            if currency is not None:
+                normalizer = read_field(element, spec["normalizer"]) if spec.get("normalizer") else 1
+                yield currency, effective_date, read_field(element, spec["rate"]), normalizer
+                number_of_records += 1
+                if number_of_records == spec.get("limit"):
+                    return
+        # the fields of a record are read when it ends, anything else can go as soon as it's done
+        if not open_records and open_elements:
+            del open_elements[-1][:]
+
+
+def parse_records(rates_xml, spec):
+    from pandas import DataFrame
+
+    return DataFrame.from_records(iter_records(rates_xml, spec),
+                                  columns=["currency", "effective_date", "rate", "normalizer"])
+
+
+# turn the raw records into the output batch (base currency, foreign currency, effective date, rate),
+# one vectorised step per column
+# source picks the source's own currency codes in currency_codes.json, besides the common ones
+def transform_records(records, spec, source=None):
+    from pandas import Series
+    from pandas import concat
+    from pandas import to_datetime
+
+    rates = records["rate"]
+    if spec.get("decimal", ".") != ".":
+        rates = rates.str.replace(spec["decimal"], ".", regex=False)
+    # use the real values of the rates
+    rates = rates.astype(float).div(records["normalizer"].astype(float))
+    if spec.get("invert"):
+        rates = 1 / rates
+    # the VATSPOTR rows quoted directly (foreign per base) are flipped row by row
+    if "quote" in records:
+        rates = rates.mask(records["quote"] == "D", 1 / rates)
+
+    currencies, in_scope = translate_currencies(records["currency"], source)
+    data = concat([Series(spec["base_currency"], index=records.index), Series(currencies, index=records.index),
+                   to_datetime(records["effective_date"].astype(str), format=spec["date_format"]), rates],
+                  axis=1, ignore_index=True)
+    if not in_scope.all():
+        data = data[in_scope].reset_index(drop=True)
+    return data
@@ -0,0 +1,69 @@
+# --profile SOURCE[:STAGE]: run the stages of one source (or just one of its stages) under cProfile and tracemalloc
+# instead of wrapping the whole script in cProfile by hand -- the stats and the allocation snapshots are saved next to
+# the rates, and the hottest functions and allocation sites are printed at the end of the run
+# cProfile only sees the thread it was enabled in, but tracemalloc sees the whole process, so the CLI only runs the
+# profiled source unless --sources says otherwise
+from contextlib import contextmanager
+from os.path import join
+from threading import Lock
+import tracemalloc
+
+# (source, stage), stage None for all of them
+profile_target = None
+# [(source, stage, cProfile.Profile, tracemalloc snapshot before, snapshot after, peak traced bytes)]
+profiles = []
+profiles_lock = Lock()
+
+
+def profiled(source, stage):
+    if profile_target is None or profile_target[0] != source:
+        return False
+    # "write" matches every write_<format> stage
+    return profile_target[1] is None or stage == profile_target[1] or stage.startswith(profile_target[1] + "_")
+
+
+@contextmanager
+def profile_stage(source, stage):
+    if not profiled(source, stage):
+        yield
+        return
+    from cProfile import Profile
+
+    # with --metrics tracemalloc is already tracing, and its peak is shared with the metrics' (see metrics.measure)
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start(25)
+    snapshot_before = tracemalloc.take_snapshot()
+    if not was_tracing:
+        tracemalloc.reset_peak()
+    profiler = Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        peak = tracemalloc.get_traced_memory()[1]
+        snapshot_after = tracemalloc.take_snapshot()
+        if not was_tracing:
+            tracemalloc.stop()
+        with profiles_lock:
+            profiles.append((source, stage, profiler, snapshot_before, snapshot_after, peak))
+
+
+# <source>_<stage>.prof (pstats, e.g. for snakeviz) and <source>_<stage>.tracemalloc (tracemalloc.Snapshot.load)
+def save_profiles(output_folder, top=10):
+    from pstats import Stats
+
+    for source, stage, profiler, snapshot_before, snapshot_after, peak in profiles:
+        profile_name = join(output_folder, "{}_{}".format(source.replace(" ", "_"), stage))
+        profiler.dump_stats(profile_name + ".prof")
+        snapshot_after.dump(profile_name + ".tracemalloc")
+
+        print("{} {}: profile saved to {}.prof, allocations to {}.tracemalloc".format(source, stage, profile_name,
+                                                                                        profile_name))
+        Stats(profiler).sort_stats("cumulative").print_stats(top)
+        print("Peak traced memory: {:.0f} KiB, top allocation sites still alive at the end of the stage:".format(
+            peak / 1024))
+        for statistic in snapshot_after.compare_to(snapshot_before, "lineno")[:top]:
+            print("    {}".format(statistic))
+        print()
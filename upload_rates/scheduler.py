@@ -0,0 +1,122 @@
+# --daemon: stay up and pick up each source's rates as soon as its bank publishes them, instead of a fixed run at a
+# fixed hour -- every source is polled only inside its publication window (see "publication" in sources.py), more and
+# more lazily while its feed stays the same, and not at all once that day's batch has arrived
+# the conditional GETs make an unchanged poll a 304 with no body, and the process keeps pandas, openpyxl and the
+# pooled connections warm between polls
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from datetime import datetime
+from datetime import time
+from datetime import timedelta
+from datetime import timezone
+from os.path import exists
+from time import sleep
+from zoneinfo import ZoneInfo
+
+from upload_rates.generate import generate_source
+from upload_rates.history import history_path
+from upload_rates.history import history_status
+from upload_rates.metrics import write_metrics
+from upload_rates import upload
+from upload_rates.sources import rate_sources
+
+
+def publication_timezone(publication):
+    if publication["timezone"] is None:
+        return datetime.now().astimezone().tzinfo  # this machine's
+    return ZoneInfo(publication["timezone"])
+
+
+# the (opening, closing) of the window on the bank's day of now, or None if the bank doesn't publish that day
+def publication_window(source, now):
+    publication = rate_sources[source]["publication"]
+    bank_timezone = publication_timezone(publication)
+    bank_day = now.astimezone(bank_timezone).date()
+    if bank_day.weekday() not in publication["weekdays"]:
+        return None
+    opening, closing = [datetime.combine(bank_day, time.fromisoformat(hour), tzinfo=bank_timezone)
+                        for hour in publication["window"]]
+    return opening, closing
+
+
+def next_window_opening(source, now):
+    for days_ahead in range(8):
+        window = publication_window(source, now + timedelta(days=days_ahead))
+        if window and window[0] > now:
+            return window[0]
+
+
+def bank_date(source, now):
+    return now.astimezone(publication_timezone(rate_sources[source]["publication"])).date()
+
+
+def last_effective_dates():
+    if not exists(history_path):
+        return {}
+    return {source: last_effective_date for source, last_effective_date, _rates in history_status()}
+
+
+# min_interval: the first poll of a window comes right at its opening, the next ones min_interval apart, growing by
+# half each time the feed hasn't changed, up to max_interval
+# metrics_folder: where to keep the run report and the Prometheus textfile up to date after every poll, if anywhere
+# upload_endpoint: where to upload the new batches after every poll, if anywhere
+def run_daemon(sources, formats=None, min_interval=60, max_interval=600, max_workers=6, delta=False,
+               metrics_folder=None, upload_endpoint=None):
+    if upload_endpoint:
+        upload.upload_queue = upload.UploadQueue()
+    last_effective = last_effective_dates()
+    done_on = {}
+    intervals = {source: min_interval for source in sources}
+    next_polls = {source: datetime.now(timezone.utc) for source in sources}
+
+    print("Waiting for the rates of {}, Ctrl+C to stop\n".format(", ".join(sources)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            now = datetime.now(timezone.utc)
+            due = []
+            for source in sources:
+                window = publication_window(source, now)
+                if done_on.get(source) == bank_date(source, now) or not window or not window[0] <= now < window[1]:
+                    continue
+                if next_polls[source] <= now:
+                    due.append(source)
+
+            futures = {executor.submit(generate_source, source, formats=formats, delta=delta): source
+                       for source in due}
+            wait(futures)
+            for future, source in futures.items():
+                try:
+                    data, written = future.result()
+                except Exception as e:
+                    print("{} crashed: {}\n".format(source, e))
+                    data, written = None, False
+                effective_date = None if data is None else data[2].max().strftime("%Y-%m-%d")
+                # a batch that was held back (or couldn't be written) is polled again, e.g. until the bank corrects it
+                if written and effective_date and effective_date > last_effective.get(source, ""):
+                    last_effective[source] = effective_date
+                    done_on[source] = bank_date(source, now)
+                    intervals[source] = min_interval
+                    print("{} done for today, next window opens {}\n".format(
+                        source, next_window_opening(source, now).strftime("%Y-%m-%d %H:%M %Z")))
+                else:
+                    next_polls[source] = datetime.now(timezone.utc) + timedelta(seconds=intervals[source])
+                    intervals[source] = min(intervals[source] * 1.5, max_interval)
+            if upload_endpoint:
+                upload.upload_batches(upload_endpoint, upload.upload_queue.take())
+            if futures and metrics_folder:
+                write_metrics(metrics_folder)
+
+            # sleep until the next poll or the next opening, but never longer than max_interval, so that a
+            # suspended laptop or a clock change only delays the schedule by that much
+            now = datetime.now(timezone.utc)
+            wake_ups = [now + timedelta(seconds=max_interval)]
+            for source in sources:
+                window = publication_window(source, now)
+                if done_on.get(source) != bank_date(source, now) and window and window[0] <= now < window[1]:
+                    wake_ups.append(next_polls[source])
+                else:
+                    opening = next_window_opening(source, now)
+                    next_polls[source] = opening
+                    intervals[source] = min_interval
+                    wake_ups.append(opening)
+            sleep(max(1, (min(wake_ups) - now).total_seconds()))
@@ -0,0 +1,65 @@
+# every central bank is a spec describing where its values live, so that all of them go through the same engine
+# and adding a bank is a new entry here rather than a new generate_* function
+# the legacy currency codes expected by the upload system and the currencies out of scope are in currency_codes.json
+#   url             - the feed; {date} is replaced with the date the rates are requested for
+#   output_name     - the output file is <output_name>_RATES_<effective date>.xlsx
+#   header          - the key of the source tag in generate_header
+#   format          - "VATSPOTR" for the tab-separated extract of the rates system, an xml feed otherwise
+#   rate_type, cur_in_scope
+#                   - the VATSPOTR slice: its rate type (its base currency is base_currency) and foreign currencies
+#   all_slices      - also write every other (rate type, base currency) slice of the VATSPOTR extract (--all-slices)
+#   base_currency   - the currency the rates are quoted in
+#   record          - the tag of the elements holding one rate each
+#   currency, rate, normalizer
+#                   - where a record's values live: "Tag" is the text of the record's child element,
+#                     "@attr" is an attribute of the record itself
+#   date            - where the effective date lives: "Tag" is the text of the last Tag element before the record,
+#                     "Tag@attr" is its attribute (history feeds carry one such element per day)
+#   date_format     - strptime format of the effective date
+#   decimal         - the decimal separator of the rates, "." by default
+#   limit           - only take the first <limit> records
+#   invert          - the feed quotes foreign per base, so flip it to base per foreign (e.g. USD/EUR, not EUR/USD)
+#   formats         - the output formats, any of output.output_writers; xlsx by default
+#   validation      - thresholds overriding validation.default_thresholds, e.g. {"max_change": 0.25}
+#   publication     - when the bank publishes, used by --daemon: the window (local time of the bank's time zone, or of
+#                     this machine without one) on the given weekdays (0 is Monday) in which new rates are expected
+#   history         - overrides of the above for the bank's dated endpoint, used by --backfill; with "per_day" the url
+#                     is requested for every day, otherwise it's a single feed holding the whole history
+rate_sources = {
+    "MA": {"url": "http://polaris-pro-ent.houston.hpe.com:8080/VATSPOTR.zip", "output_name": "MOROCCO",
+           "header": "MA", "base_currency": "MAD", "format": "VATSPOTR", "rate_type": "CBSEL",
+           "cur_in_scope": ["AED", "CAD", "CHF", "DZD", "EUR", "GBP", "LYD", "SAR", "SEK", "TND", "USD"],
+           "date_format": "%Y%m%d",
+           "publication": {"timezone": None, "window": ("12:00", "18:00"), "weekdays": [0, 1, 2, 3, 4]}},
+    "TR": {"url": "http://www.tcmb.gov.tr/kurlar/today.xml", "output_name": "TURKEY", "header": "TR",
+           "base_currency": "TRY", "record": "Currency", "currency": "@CurrencyCode", "rate": "ForexBuying",
+           "normalizer": "Unit", "date": "Tarih_Date@Date", "date_format": "%m/%d/%Y",
+           "limit": 12,  # first twelve currencies
+           "publication": {"timezone": "Europe/Istanbul", "window": ("15:25", "17:30"), "weekdays": [0, 1, 2, 3, 4]},
+           "history": {"url": "http://www.tcmb.gov.tr/kurlar/{date:%Y%m}/{date:%d%m%Y}.xml", "per_day": True}},
+    "SK": {"url": "http://www.ecb.europa.eu/stats/eurofxref/eurofxref-daily.xml", "output_name": "SLOVAKIA",
+           "header": "SK", "base_currency": "EUR", "record": "Cube", "currency": "@currency", "rate": "@rate",
+           "date": "Cube@time", "date_format": "%Y-%m-%d", "invert": True,
+           "publication": {"timezone": "Europe/Berlin", "window": ("15:55", "17:30"), "weekdays": [0, 1, 2, 3, 4]},
+           "history": {"url": "http://www.ecb.europa.eu/stats/eurofxref/eurofxref-hist.xml", "per_day": False}},
+    "RU": {"url": "http://www.cbr.ru/scripts/XML_daily_eng.asp?date_req={date:%d/%m/%Y}", "output_name": "RUSSIA",
+           "header": "RU", "base_currency": "RUB", "record": "Valute", "currency": "CharCode", "rate": "Value",
+           "normalizer": "Nominal", "decimal": ",", "date": "ValCurs@Date", "date_format": "%d.%m.%Y",
+           "publication": {"timezone": "Europe/Moscow", "window": ("08:00", "12:00"), "weekdays": [0, 1, 2, 3, 4]},
+           "history": {"url": "http://www.cbr.ru/scripts/XML_daily_eng.asp?date_req={date:%d/%m/%Y}",
+                       "per_day": True}},
+    "PL A": {"url": "http://www.nbp.pl/kursy/xml/LastA.xml", "output_name": "POLAND_A", "header": "PL",
+             "base_currency": "PLN", "record": "pozycja", "currency": "kod_waluty", "rate": "kurs_sredni",
+             "normalizer": "przelicznik", "decimal": ",", "date": "data_publikacji", "date_format": "%Y-%m-%d",
+             "publication": {"timezone": "Europe/Warsaw", "window": ("11:45", "13:30"), "weekdays": [0, 1, 2, 3, 4]},
+             "history": {"url": "http://api.nbp.pl/api/exchangerates/tables/A/{date:%Y-%m-%d}/?format=xml",
+                         "per_day": True, "record": "Rate", "currency": "Code", "rate": "Mid", "normalizer": None,
+                         "decimal": ".", "date": "EffectiveDate"}},
+    "PL B": {"url": "http://www.nbp.pl/kursy/xml/LastB.xml", "output_name": "POLAND_B", "header": "PL",
+             "base_currency": "PLN", "record": "pozycja", "currency": "kod_waluty", "rate": "kurs_sredni",
+             "normalizer": "przelicznik", "decimal": ",", "date": "data_publikacji", "date_format": "%Y-%m-%d",
+             "publication": {"timezone": "Europe/Warsaw", "window": ("11:45", "13:30"), "weekdays": [2]},
+             "history": {"url": "http://api.nbp.pl/api/exchangerates/tables/B/{date:%Y-%m-%d}/?format=xml",
+                         "per_day": True, "record": "Rate", "currency": "Code", "rate": "Mid", "normalizer": None,
+                         "decimal": ".", "date": "EffectiveDate"}},
+}
@@ -0,0 +1,111 @@
+# --upload URL: push the batches of the run to the rates import endpoint instead of leaving the files for someone to
+# upload by hand -- the written batches are queued, and sent a few sources per request through the pooled client
+# every batch carries its own idempotency_key, a hash of its source, effective date and rates, and the endpoint imports
+# a key it already has only once -- so a retried request, or a re-run that sends the same rates again (grouped into
+# other requests or not), doesn't import a batch twice, while corrected rates get a new key; the client retries the
+# requests like a GET
+# a request that still fails once the client has given up is kept in unsent_uploads.json and sent again, as it was,
+# before anything else by the next run or the daemon's next poll
+# python -m upload_rates.upload_server is a stand-in endpoint for testing
+from hashlib import sha256
+from http.client import HTTPException
+from os import makedirs
+from os import remove
+from os.path import dirname
+from os.path import exists
+from threading import Lock
+import json
+
+from upload_rates.client import http_client
+
+
+def idempotency_key(source, effective_date, rates):
+    return sha256(json.dumps([source, effective_date, rates]).encode()).hexdigest()
+
+
+# {"source": ..., "source_tag": ..., "base_currency": ..., "effective_date": ..., "rates": [[foreign, date, rate], ...],
+#  "idempotency_key": ...}
+def batch_payload(source, source_tag, data):
+    effective_date = data[2].max().strftime("%Y-%m-%d")
+    rates = [[foreign_cur, rate_date.strftime("%Y-%m-%d"), float(rate)]
+             for _base_cur, foreign_cur, rate_date, rate in data.itertuples(index=False)]
+    return {"source": source, "source_tag": source_tag, "base_currency": data.iloc[0, 0],
+            "effective_date": effective_date, "rates": rates,
+            "idempotency_key": idempotency_key(source, effective_date, rates)}
+
+
+class UploadQueue:
+    def __init__(self):
+        self.batches = []
+        self.lock = Lock()
+
+    def add(self, source, source_tag, data):
+        with self.lock:
+            self.batches.append(batch_payload(source, source_tag, data))
+
+    # everything queued so far, leaving the queue empty
+    def take(self):
+        with self.lock:
+            batches, self.batches = self.batches, []
+        return batches
+
+
+upload_queue = None
+
+
+unsent_uploads_path = "Rates\\unsent_uploads.json"
+
+
+# the bodies of the requests that couldn't be sent yet
+def load_unsent_uploads():
+    try:
+        with open(unsent_uploads_path) as unsent_uploads_file:
+            return json.load(unsent_uploads_file)
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def save_unsent_uploads(bodies):
+    if not bodies:
+        if exists(unsent_uploads_path):
+            remove(unsent_uploads_path)
+        return
+    if dirname(unsent_uploads_path):
+        makedirs(dirname(unsent_uploads_path), exist_ok=True)
+    with open(unsent_uploads_path, "w") as unsent_uploads_file:
+        json.dump(bodies, unsent_uploads_file, indent=2)
+
+
+# returns whether the endpoint took the request
+def send_upload(endpoint, body):
+    sources = ", ".join("{} {}".format(batch["source"], batch["effective_date"])
+                        for batch in json.loads(body)["batches"])
+    headers = {"Content-Type": "application/json"}
+    try:
+        with http_client.request("POST", endpoint, headers, body.encode(), idempotent=True) as response:
+            response.read()
+        print("{} rates uploaded :)\n".format(sources))
+        return True
+    except (OSError, HTTPException) as e:
+        print("Oops! Cannot upload {} rates to {} ({})\n".format(sources, endpoint, e))
+        return False
+
+
+# the requests left over from the last time go first
+# returns the number of batches that couldn't be uploaded, and are left for the next time
+def upload_batches(endpoint, batches, sources_per_request=4):
+    # in a fixed order, so that the same batches always make the same requests with the same keys
+    batches = sorted(batches, key=lambda batch: (batch["source"], batch["effective_date"]))
+    bodies = load_unsent_uploads()
+    # e.g. the same batch failed by the last run too
+    unsent_keys = {batch.get("idempotency_key") for body in bodies for batch in json.loads(body)["batches"]}
+    batches = [batch for batch in batches if batch["idempotency_key"] not in unsent_keys]
+    for first in range(0, len(batches), sources_per_request):
+        bodies.append(json.dumps({"batches": batches[first:first + sources_per_request]}, sort_keys=True))
+    unsent = [body for body in bodies if not send_upload(endpoint, body)]
+    save_unsent_uploads(unsent)
+    failed = sum(len(json.loads(body)["batches"]) for body in unsent)
+    if failed:
+        print("{} batch(es) not uploaded, they will be sent again by the next run ({})\n".format(
+            failed, unsent_uploads_path))
+    return failed
@@ -0,0 +1,75 @@
+# a stand-in for the rates import endpoint, to try --upload without the real system:
+#
+# python -m upload_rates.upload_server --port 8780 --received received.jsonl
+# python -m upload_rates --upload http://localhost:8780/import
+#
+# it accepts the batches POSTed by upload.py, skips a batch whose idempotency_key it has already imported (whichever
+# request it came in), and with --fail-every N answers every Nth request with a 503 to exercise the retries
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from threading import Lock
+import json
+
+
+class ImportHandler(BaseHTTPRequestHandler):
+    # keep-alive, like the real endpoint, so that the pooled connections get reused
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status, answer):
+        body = json.dumps(answer).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server.lock:
+            server.requests += 1
+            if server.fail_every and server.requests % server.fail_every == 0:
+                self.send_json(503, {"status": "try again"})
+                return
+            try:
+                batches = json.loads(body)["batches"]
+            except (ValueError, KeyError):
+                self.send_json(400, {"status": "not a list of batches"})
+                return
+            imported = [batch for batch in batches if batch.get("idempotency_key") not in server.imported_keys]
+            with open(server.received_location, "a") as received:
+                for batch in imported:
+                    received.write(json.dumps(batch) + "\n")
+                    if batch.get("idempotency_key"):
+                        server.imported_keys.add(batch["idempotency_key"])
+        answer = {"status": "imported" if imported else "duplicate", "batches": len(imported),
+                  "duplicates": len(batches) - len(imported), "rates": sum(len(batch["rates"]) for batch in imported)}
+        if imported:
+            print("Imported {}".format(", ".join("{} {}".format(batch["source"], batch["effective_date"])
+                                                 for batch in imported)))
+        self.send_json(201 if imported else 200, answer)
+
+
+def main(argv=None):
+    parser = ArgumentParser(prog="upload_rates.upload_server", description="A stand-in rates import endpoint.")
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument("--received", default="received.jsonl", help="where the imported batches are appended")
+    parser.add_argument("--fail-every", type=int, default=0, metavar="N", help="answer every Nth request with a 503")
+    args = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer(("localhost", args.port), ImportHandler)
+    server.lock = Lock()
+    server.requests = 0
+    server.imported_keys = set()
+    server.fail_every = args.fail_every
+    server.received_location = args.received
+    print("Listening on http://localhost:{}/, Ctrl+C to stop".format(args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# a bad feed (a decimal comma read as a thousands separator, a wrong normalizer...) must not reach the upload: every
+# new batch is joined, currency by currency, to the latest rate of that currency before the row's effective date in the
+# history, and a batch with a rate that moved more than max_change, or with currencies that went missing or appeared,
+# is held back for a human to look at
+# a currency is new if the source has never had it, and missing if it was in the source's previous batch (the rates
+# of its latest effective date) -- so a slice mixing effective dates, or the same batch run again, passes
+# one merge and a few column operations over the whole batch, so it costs milliseconds
+# the thresholds can be overridden per source with "validation" in sources.py
+default_thresholds = {"max_change": 0.10, "max_missing": 0, "max_new": 0}
+# --no-validation
+validation_enabled = True
+
+issue_columns = ["FOREIGN_CURRENCY", "ISSUE", "PREVIOUS_RATE", "RATE", "CHANGE"]
+
+
+def validation_thresholds(spec):
+    return dict(default_thresholds, **spec.get("validation", {}))
+
+
+# previous_rates: the latest rate of every currency before the batch, see history.read_previous_rates
+# returns the issues found (one row per currency: "moved", "missing" or "new") and whether the batch is to be held
+def validate_batch(data, previous_rates, thresholds=None):
+    from numpy import select
+    from pandas import DataFrame
+
+    thresholds = thresholds or default_thresholds
+    if previous_rates is None:  # nothing to compare to yet
+        return DataFrame(columns=issue_columns), False
+
+    joined = DataFrame({"FOREIGN_CURRENCY": data[1], "RATE": data[3]}).merge(
+        DataFrame({"FOREIGN_CURRENCY": previous_rates[1], "PREVIOUS_RATE": previous_rates[3],
+                   "PREVIOUS_DATE": previous_rates[2]}),
+        on="FOREIGN_CURRENCY", how="outer", indicator=True)
+    joined["CHANGE"] = joined["RATE"] / joined["PREVIOUS_RATE"] - 1
+    # a currency with no rate before its date (e.g. the same batch run again) has nothing to have moved from
+    moved = (joined["_merge"] == "both") & joined["PREVIOUS_RATE"].notna() & ~(
+        joined["CHANGE"].abs() <= thresholds["max_change"])
+    missing = (joined["_merge"] == "right_only") & (joined["PREVIOUS_DATE"] == previous_rates[2].max())
+    new = joined["_merge"] == "left_only"
+    joined["ISSUE"] = select([moved, missing, new], ["moved", "missing", "new"], default="")
+
+    issues = joined.loc[moved | missing | new, issue_columns].reset_index(drop=True)
+    held = moved.any() or missing.sum() > thresholds["max_missing"] or new.sum() > thresholds["max_new"]
+    return issues, held
@@ -0,0 +1,102 @@
+# VATSPOTR.txt mixes many rate types (CBCUR, CBSEL, CBBUY, RVAL1, RVALS...) and base currencies (DKK, EUR, HUF, MAD...)
+# -- the extract is decompressed once into a memory-mapped temporary file and indexed in a single scan by (rate type,
+# base currency), so every slice is then cut straight out of the map and only its own lines are ever tokenised
+from array import array
+from io import BytesIO
+from mmap import ACCESS_READ
+from mmap import mmap
+from shutil import copyfileobj
+from tempfile import TemporaryFile
+from zipfile import ZipFile
+
+# the columns kept from the extract:
+# 0 - rate type, 2 - base currency, 3 - foreign currency, 4 - effective date, 6 - quote ("I" - indirect, base per
+# foreign; "D" - direct, foreign per base, e.g. CBCUR EUR and the RVAL* slices), 7 - rate, 8 - normalizer
+VATSPOTR_columns = [0, 2, 3, 4, 6, 7, 8]
+
+
+class VATSPOTRIndex:
+    def __init__(self, VATSPOTR_zip):
+        self.VATSPOTR_txt = TemporaryFile()
+        with ZipFile(VATSPOTR_zip, "r") as myzip, myzip.open("VATSPOTR.txt") as VATSPOTR_member:
+            copyfileobj(VATSPOTR_member, self.VATSPOTR_txt, 1024 * 1024)
+        self.VATSPOTR_txt.flush()
+        self.map = mmap(self.VATSPOTR_txt.fileno(), 0, access=ACCESS_READ) if self.VATSPOTR_txt.tell() else b""
+        # {(rate type, base currency): array of start, end byte offsets}, consecutive lines of a slice merged into
+        # one span
+        self.spans = {}
+        self.scan()
+
+    def scan(self):
+        position = self.map.find(b"\n") + 1  # the first line is the timestamp and the number of rows
+        if not position:
+            return
+        size = len(self.map)
+        while position < size:
+            end = self.map.find(b"\n", position)
+            end = size if end == -1 else end + 1
+            fields = self.map[position:end].split(b"\t", 3)
+            if len(fields) > 3:
+                key = (fields[0].decode(), fields[2].decode())
+                spans = self.spans.get(key)
+                if spans is None:
+                    self.spans[key] = array("Q", [position, end])
+                elif spans[-1] == position:
+                    spans[-1] = end
+                else:
+                    spans.extend((position, end))
+            position = end
+
+    def keys(self):
+        return list(self.spans)
+
+    # the raw lines of a (rate type, base currency) slice
+    def lines(self, rate_type, base_cur):
+        spans = self.spans.get((rate_type, base_cur), [])
+        return b"".join(self.map[spans[i]:spans[i + 1]] for i in range(0, len(spans), 2))
+
+    # the slice as a DataFrame with the VATSPOTR_columns, only the foreign currencies in cur_in_scope if given
+    def read(self, rate_type, base_cur, cur_in_scope=None):
+        from pandas import DataFrame
+        from pandas import read_csv
+
+        slice_lines = self.lines(rate_type, base_cur)
+        if not slice_lines:
+            return DataFrame(columns=VATSPOTR_columns)
+        VATSPOTR_slice = read_csv(BytesIO(slice_lines), sep="\t", header=None, usecols=VATSPOTR_columns,
+                                  dtype={4: str})
+        if cur_in_scope is not None:
+            VATSPOTR_slice = VATSPOTR_slice[VATSPOTR_slice[3].isin(cur_in_scope)].reset_index(drop=True)
+        return VATSPOTR_slice
+
+    # every slice as a DataFrame with the VATSPOTR_columns: {(rate type, base currency): slice}
+    # the lines are laid out slice after slice from the spans and tokenised in one go, then cut by their line counts
+    def read_slices(self):
+        from pandas import read_csv
+
+        keys = self.keys()
+        if not keys:
+            return {}
+        # the last line of the extract may come without its newline, and may not be last once rearranged
+        slice_lines = [lines if lines.endswith(b"\n") else lines + b"\n"
+                       for lines in (self.lines(rate_type, base_cur) for rate_type, base_cur in keys)]
+        VATSPOTR_data = read_csv(BytesIO(b"".join(slice_lines)), sep="\t", header=None, usecols=VATSPOTR_columns,
+                                 dtype={4: str})
+        slices = {}
+        start = 0
+        for key, lines in zip(keys, slice_lines):
+            end = start + lines.count(b"\n")
+            slices[key] = VATSPOTR_data.iloc[start:end].reset_index(drop=True)
+            start = end
+        return slices
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.VATSPOTR_txt.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()